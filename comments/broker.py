@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+# Messages a slow subscriber may fall behind by before it is told to reload
+QUEUE_SIZE = 100
+
+# Put on a subscriber's queue in place of the messages it missed
+OVERFLOW = object()
+
+
+def encode_message(kind, data):
+    """
+    Encodes one message as a Server-Sent Events frame, once for every subscriber.
+    """
+    return f'event: {kind}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode()
+
+
+class Subscription:
+    """
+    One subscriber's bounded queue of encoded messages, owned by the event
+    loop it was created on. Messages may be delivered from any thread.
+    """
+    def __init__(self, event, maxsize=QUEUE_SIZE):
+        self.event = event
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind to catch up: drop the backlog and tell the client to reload instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    def send(self, message):
+        self.loop.call_soon_threadsafe(self.deliver, message)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broker:
+    """
+    Fans comment messages out to the subscribers of each event. Subclasses
+    decide how messages reach other processes.
+    """
+    def subscribe(self, event):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, event, kind, data):
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """
+    Delivers messages to subscribers in this process only, so it suits a
+    single web process and the tests. An idle subscriber costs a queue and
+    a set entry; nothing runs for it until a message arrives.
+    """
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, event):
+        subscription = Subscription(event)
+        with self.lock:
+            self.subscribers.setdefault(event, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.event)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.event]
+
+    def publish(self, event, kind, data):
+        with self.lock:
+            subscribers = list(self.subscribers.get(event, ()))
+        if not subscribers:
+            return 0
+        message = encode_message(kind, data)
+        for subscription in subscribers:
+            subscription.send(message)
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.COMMENTS_BROKER)()
+    return _broker
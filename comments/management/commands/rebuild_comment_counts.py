@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comments.models import EventCommentCount
+
+
+class Command(BaseCommand):
+    help = 'Recounts the comments on every event from scratch'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            EventCommentCount.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt comment counts for {EventCommentCount.objects.count()} events'
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_comments(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    EventCommentCount = apps.get_model('comments', 'EventCommentCount')
+    per_event = Comment.objects.values('event').annotate(total=Count('id'))
+    EventCommentCount.objects.bulk_create([
+        EventCommentCount(event=row['event'], count=row['total']) for row in per_event
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0002_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventCommentCount',
+            fields=[
+                ('event', models.IntegerField(help_text='ReliefWeb event ID', primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_comments, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 
 # Create your models here.
 class Comment(models.Model):
@@ -12,5 +14,42 @@ class Comment(models.Model):
     )
     event = models.IntegerField(help_text='ReliefWeb event ID')
 
+    class Meta:
+        # Cover the per-event and per-author listings, which page newest first on (created_at, id)
+        indexes = [
+            models.Index(fields=['event', 'created_at', 'id'], name='comment_event_created_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='comment_author_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Comment {self.id} by {self.author.username} on event {self.event}'
+
+
+class EventCommentCount(models.Model):
+    # Denormalized number of comments per ReliefWeb event, kept in step by the comment views
+    event = models.IntegerField(primary_key=True, help_text='ReliefWeb event ID')
+    count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
-        return f'Comment {self.id} by {self.author.username} on event {self.event}'
\ No newline at end of file
+        return f'{self.count} comments on event {self.event}'
+
+    @classmethod
+    def adjust(cls, event, delta):
+        cls.objects.get_or_create(event=event)
+        # Never below zero, even if the counts drifted (`rebuild_comment_counts` puts them right)
+        cls.objects.filter(event=event).update(count=Greatest(F('count') + delta, 0))
+
+    @classmethod
+    def remove_author(cls, author):
+        """
+        Takes an author's comments off the counts, before their account is deleted.
+        """
+        per_event = Comment.objects.filter(author=author).values('event').annotate(total=Count('id'))
+        for row in per_event:
+            cls.objects.filter(event=row['event']).update(count=Greatest(F('count') - row['total'], 0))
+
+    @classmethod
+    def rebuild(cls):
+        per_event = Comment.objects.values('event').annotate(total=Count('id'))
+        cls.objects.all().delete()
+        cls.objects.bulk_create([cls(event=row['event'], count=row['total']) for row in per_event])
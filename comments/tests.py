@@ -1,3 +1,304 @@
-from django.test import TestCase
+import asyncio
+import io
+import time
+from unittest import skipUnless
+from unittest.mock import call, patch
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from lib.pagination import encode_cursor
+from lib.routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware, pinned_key
+from users.models import User
+from users.serializers.token import CustomTokenSerializer
+from .broker import OVERFLOW, Subscription, get_broker
+from .models import Comment, EventCommentCount
+from .views import comment_events
 
-# Create your tests here.
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        Comment.objects.bulk_create([
+            Comment(content=f'Update {number}', author=cls.user, event=52391)
+            for number in range(45)
+        ])
+
+    def get_page(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_pages_are_bounded_and_deep_pages_cost_the_same(self):
+        page, first_queries = self.get_page('/api/comments/?event=52391')
+        seen = [comment['id'] for comment in page['results']]
+        self.assertEqual(len(page['results']), 20)
+        self.assertEqual(first_queries, 1)
+
+        while page['cursor']:
+            page, queries = self.get_page(f"/api/comments/?event=52391&cursor={page['cursor']}")
+            self.assertLessEqual(len(page['results']), 20)
+            self.assertEqual(queries, first_queries)
+            seen += [comment['id'] for comment in page['results']]
+
+        # Every comment exactly once, newest first, even though bulk_create gave many the same timestamp
+        expected = list(Comment.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_limit_is_capped(self):
+        page, _ = self.get_page('/api/comments/?user=%d&limit=1000' % self.user.id)
+        self.assertEqual(len(page['results']), 45)
+        page, _ = self.get_page('/api/comments/?user=%d&limit=5' % self.user.id)
+        self.assertEqual(len(page['results']), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/comments/?event=52391&cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+        # Well formed tokens with values that aren't an aware timestamp and an integer id
+        forged = [
+            ['garbage', 1], [None, 1], [{'a': 1}, 1], ['2024-01-01T00:00:00', 1],
+            ['2024-13-01T00:00:00Z', 1], ['2024-01-01T00:00:00Z', 'x'], ['2024-01-01T00:00:00Z', True],
+        ]
+        for values in forged:
+            response = self.client.get(f'/api/comments/?event=52391&cursor={encode_cursor(values)}')
+            self.assertEqual(response.status_code, 400, values)
+            self.assertEqual(response.json(), {'cursor': 'Invalid cursor'})
+
+
+class CommentCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        token = CustomTokenSerializer.get_token(self.user).access_token
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    def post_comment(self, event):
+        response = self.client.post('/api/comments/', {'content': 'Roads closed', 'event': event})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def get_counts(self, events):
+        return self.client.get(f'/api/comments/counts/?events={events}').json()
+
+    def test_counts_follow_creates_and_deletes(self):
+        first = self.post_comment(1)
+        self.post_comment(1)
+        self.post_comment(2)
+        self.assertEqual(self.get_counts('1,2,3'), {'1': 2, '2': 1, '3': 0})
+
+        self.client.delete(f'/api/comments/{first}/')
+        self.assertEqual(self.get_counts('1,2'), {'1': 1, '2': 1})
+
+    def test_counts_follow_a_comment_moved_between_events(self):
+        comment = self.post_comment(1)
+        self.client.put(f'/api/comments/{comment}/', {'content': 'Wrong event', 'event': 2}, content_type='application/json')
+        self.assertEqual(self.get_counts('1,2'), {'1': 0, '2': 1})
+
+    def test_counts_are_one_query(self):
+        self.post_comment(1)
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        with self.assertNumQueries(1):
+            self.get_counts(','.join(str(event) for event in range(100)))
+
+    def test_deleting_an_account_removes_its_comments_from_the_counts(self):
+        self.post_comment(1)
+        self.client.delete('/api/auth/profile/')
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assertEqual(self.get_counts('1'), {'1': 0})
+
+    def test_invalid_events_are_rejected(self):
+        self.assertEqual(self.client.get('/api/comments/counts/?events=1,abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/counts/').status_code, 400)
+
+    def test_rebuild_command_recounts_from_comments(self):
+        Comment.objects.create(content='Imported', author=self.user, event=7)
+        call_command('rebuild_comment_counts', stdout=io.StringIO())
+        self.assertEqual(EventCommentCount.objects.get(event=7).count, 1)
+
+
+class CommentQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # A different author per comment, so a per-row author lookup would show up as extra queries
+        authors = [
+            User.objects.create_user(username=f'writer{number}', email=f'writer{number}@example.com', password='pass12345!')
+            for number in range(10)
+        ]
+        Comment.objects.bulk_create([
+            Comment(content=f'Update {number}', author=authors[number % 10], event=52391)
+            for number in range(30)
+        ])
+        cls.author = authors[0]
+
+    def test_event_listing_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/comments/?event=52391')
+        self.assertEqual(len({comment['author_username'] for comment in response.json()['results']}), 10)
+
+    def test_user_listing_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/comments/?user={self.author.id}')
+
+    def test_detail_is_one_query(self):
+        comment = Comment.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/comments/{comment.id}/')
+        self.assertEqual(response.json()['author_username'], comment.author.username)
+
+
+class CommentStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        token = CustomTokenSerializer.get_token(self.user).access_token
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    def test_writes_are_published_once_committed(self):
+        with patch.object(get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                comment = self.client.post('/api/comments/', {'content': 'Roads closed', 'event': 1}).json()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(f"/api/comments/{comment['id']}/", {'content': 'Roads open', 'event': 1}, content_type='application/json')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(f"/api/comments/{comment['id']}/", {'content': 'Roads open', 'event': 2}, content_type='application/json')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(f"/api/comments/{comment['id']}/")
+
+        self.assertEqual([(args[0], args[1]) for args, _ in publish.call_args_list], [
+            (1, 'created'), (1, 'updated'), (1, 'deleted'), (2, 'created'), (2, 'deleted')
+        ])
+        self.assertEqual(publish.call_args_list[0].args[2]['content'], 'Roads closed')
+        self.assertEqual(publish.call_args_list[-1], call(2, 'deleted', {'id': comment['id'], 'event': 2}))
+
+    @override_settings(COMMENTS_STREAM_HEARTBEAT=0.05)
+    async def test_stream_delivers_messages_and_heartbeats(self):
+        broker = get_broker()
+        stream = comment_events(7)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        # Published from another thread, as the sync comment views do
+        await asyncio.to_thread(broker.publish, 7, 'created', {'id': 1})
+        await asyncio.to_thread(broker.publish, 8, 'created', {'id': 2})
+        self.assertEqual(await anext(stream), b'event: created\ndata: {"id": 1}\n\n')
+        self.assertEqual(await anext(stream), b': heartbeat\n\n')
+
+        await stream.aclose()
+        self.assertNotIn(7, broker.subscribers)
+
+    async def test_slow_subscriber_is_reset(self):
+        subscription = Subscription(7, maxsize=2)
+        for number in range(3):
+            subscription.deliver(f'message {number}'.encode())
+
+        self.assertIs(await subscription.get(1), OVERFLOW)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_stream_response(self):
+        response = await self.async_client.get('/api/comments/events/7/stream/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(await anext(aiter(response.streaming_content)), b'retry: 5000\n\n')
+        await response.streaming_content.aclose()
+
+
+def token_for(user, age=60):
+    token = CustomTokenSerializer.get_token(user).access_token
+    token['iat'] = int(time.time()) - age
+    return f'Bearer {token}'
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_LAG=5)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        self.other = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345!')
+
+    def route(self, method, authorization=None):
+        # Where the request's reads would go
+        seen = []
+        middleware = ReplicaRoutingMiddleware(lambda request: seen.append(PrimaryReplicaRouter().db_for_read(Comment)) or HttpResponse())
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        middleware(getattr(RequestFactory(), method)('/api/comments/', **headers))
+        return seen[0]
+
+    def test_safe_reads_go_to_a_replica(self):
+        self.assertEqual(self.route('get'), 'replica')
+        self.assertEqual(self.route('get', token_for(self.user)), 'replica')
+        self.assertEqual(self.route('post', token_for(self.user)), 'default')
+
+    def test_writers_read_their_writes(self):
+        self.route('post', token_for(self.user))
+        self.assertEqual(self.route('get', token_for(self.user)), 'default')
+        self.assertEqual(self.route('get', token_for(self.other)), 'replica')
+
+        cache.delete(pinned_key(self.user.id))
+        self.assertEqual(self.route('get', token_for(self.user)), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica2'])
+    def test_a_request_reads_from_one_replica(self):
+        seen = []
+
+        def view(request):
+            seen.extend(PrimaryReplicaRouter().db_for_read(Comment) for _ in range(20))
+            return HttpResponse()
+
+        for _ in range(5):
+            seen.clear()
+            ReplicaRoutingMiddleware(view)(RequestFactory().get('/api/comments/'))
+            self.assertEqual(len(set(seen)), 1)
+
+    def test_fresh_tokens_read_from_the_primary(self):
+        self.assertEqual(self.route('get', token_for(self.user, age=0)), 'default')
+
+    async def test_async_requests_are_routed_the_same(self):
+        seen = []
+
+        async def view(request):
+            # Where a query made through sync_to_async, as views do, would read from
+            seen.append(await sync_to_async(PrimaryReplicaRouter().db_for_read)(Comment))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        authorization = await sync_to_async(token_for)(self.user)
+        await middleware(RequestFactory().post('/api/comments/', HTTP_AUTHORIZATION=authorization))
+        await middleware(RequestFactory().get('/api/comments/', HTTP_AUTHORIZATION=authorization))
+        await middleware(RequestFactory().get('/api/comments/'))
+        self.assertEqual(seen, ['default', 'default', 'replica'])
+
+    @override_settings(DEBUG=True)
+    def test_asgi_chain_has_no_sync_middleware(self):
+        # Django logs each sync-only middleware it has to run the chain in a thread for
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    def test_reads_outside_requests_use_the_primary(self):
+        # Management commands and background jobs, e.g. sync reading what it is about to update
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Comment), 'default')
+
+
+# Needs a `replica` database in DATABASES, e.g. a second SQLite file
+@skipUnless('replica' in settings.DATABASES, 'No replica database configured')
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_LAG=5)
+class ReplicaDatabaseTests(TestCase):
+    databases = '__all__'
+
+    def test_replica_lag_is_hidden_from_the_writer(self):
+        cache.clear()
+        user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        authorization = token_for(user)
+        response = self.client.post('/api/comments/', {'content': 'Roads closed', 'event': 9}, HTTP_AUTHORIZATION=authorization)
+        self.assertEqual(response.status_code, 201)
+
+        # The test replica is a separate database that never receives the write, like one lagging behind
+        self.assertEqual(self.client.get('/api/comments/?event=9').json()['results'], [])
+        results = self.client.get('/api/comments/?event=9', HTTP_AUTHORIZATION=authorization).json()['results']
+        self.assertEqual([comment['content'] for comment in results], ['Roads closed'])
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import CommentListView, CommentDetailView
+from .views import CommentListView, CommentDetailView, CommentCountView, comment_stream
 
 urlpatterns = [
     path('', CommentListView.as_view()),
-    path('<int:pk>/', CommentDetailView.as_view())
+    path('<int:pk>/', CommentDetailView.as_view()),
+    path('counts/', CommentCountView.as_view()),
+    path('events/<int:event>/stream/', comment_stream)
 ]
\ No newline at end of file
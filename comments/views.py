@@ -1,30 +1,130 @@
+import asyncio
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.views import APIView
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from lib.permissions import CommentOwnerOrReadOnly
-from .models import Comment
+from lib.pagination import KeysetPagination
+from search.index import index_comments, remove_documents
+from search.models import SearchDocument
+from .broker import OVERFLOW, get_broker
+from .models import Comment, EventCommentCount
 from .serializers.common import CommentSerializer
 from rest_framework.exceptions import ValidationError
 
+# Most events a single counts request may ask for
+MAX_COUNT_EVENTS = 200
+
+
+def publish(event, kind, data):
+    # Subscribers only hear about a change once it is committed
+    transaction.on_commit(lambda: get_broker().publish(event, kind, data))
+
+
 class CommentListView(ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         event_id = self.request.query_params.get('event')
         user_id = self.request.query_params.get('user')
 
+        comments = Comment.objects.select_related('author')
+
         if event_id:
-            return Comment.objects.filter(event=event_id).order_by('-created_at')
+            return comments.filter(event=event_id)
         elif user_id:
-            return Comment.objects.filter(author=user_id).order_by('-created_at')
+            return comments.filter(author=user_id)
         else:
             raise ValidationError({ 'detail': 'Query parameter for event or user is required'})
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # The token user carries the id only, which is all the foreign key needs
+        comment = serializer.save(author_id=self.request.user.id)
+        EventCommentCount.adjust(comment.event, 1)
+        index_comments([comment])
+        # serializer.data is cached, so the response reuses this serialization
+        publish(comment.event, 'created', serializer.data)
 
 
 class CommentDetailView(RetrieveUpdateDestroyAPIView):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
-    permission_classes = [CommentOwnerOrReadOnly]
\ No newline at end of file
+    permission_classes = [CommentOwnerOrReadOnly]
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous_event = serializer.instance.event
+        comment = serializer.save()
+        index_comments([comment])
+        if comment.event != previous_event:
+            EventCommentCount.adjust(previous_event, -1)
+            EventCommentCount.adjust(comment.event, 1)
+            publish(previous_event, 'deleted', {'id': comment.id, 'event': previous_event})
+            publish(comment.event, 'created', serializer.data)
+        else:
+            publish(comment.event, 'updated', serializer.data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        EventCommentCount.adjust(instance.event, -1)
+        publish(instance.event, 'deleted', {'id': instance.id, 'event': instance.event})
+        remove_documents(SearchDocument.COMMENT, [instance.id])
+        instance.delete()
+
+
+class CommentCountView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request):
+        try:
+            events = {int(event) for event in request.query_params.get('events', '').split(',') if event}
+        except ValueError:
+            raise ValidationError({ 'events': 'Must be a comma separated list of event IDs'})
+        if not events:
+            raise ValidationError({ 'events': 'Query parameter for events is required'})
+        if len(events) > MAX_COUNT_EVENTS:
+            raise ValidationError({ 'events': f'At most {MAX_COUNT_EVENTS} events per request'})
+
+        counts = dict.fromkeys(events, 0)
+        counts.update(EventCommentCount.objects.filter(event__in=events).values_list('event', 'count'))
+        return Response({ str(event): count for event, count in counts.items() })
+
+
+async def comment_events(event):
+    broker = get_broker()
+    subscription = broker.subscribe(event)
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield b'retry: 5000\n\n'
+        while True:
+            try:
+                message = await subscription.get(settings.COMMENTS_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing the idle connection, and finds clients that have gone
+                yield b': heartbeat\n\n'
+                continue
+            if message is OVERFLOW:
+                yield b'event: reset\ndata: {}\n\n'
+                return
+            yield message
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def comment_stream(request, event):
+    """
+    Streams the comments created, updated and deleted on one event as
+    Server-Sent Events (`created`, `updated`, `deleted`). A `reset` event
+    means the client fell too far behind and should reload the list.
+    Served without a worker thread per viewer when run under ASGI.
+    """
+    response = StreamingHttpResponse(comment_events(event), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
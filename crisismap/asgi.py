@@ -2,6 +2,8 @@
 ASGI config for crisismap project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is what the web process serves (see the Procfile), so the comment
+streams hold an idle coroutine per viewer rather than a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -71,21 +71,30 @@ INSTALLED_APPS = [
     'users',
     'comments',
     'reliefweb',
+    'search',
     
 ]
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.token.CustomTokenSerializer',
+    'TOKEN_USER_CLASS': 'lib.authentication.ClaimsUser',
 }
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'lib.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    )
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'lib.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Proxies in front of the app, for throttling to find the client IP in
+    # X-Forwarded-For; deployed, that is the platform's router
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=0 if DEBUG else 1),
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -98,9 +107,12 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 
 
 MIDDLEWARE = [
+    'lib.metrics.MetricsMiddleware',
+    'lib.routers.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'lib.static.AsyncWhiteNoiseMiddleware',
+    'lib.http.EventStreamSafeGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -139,10 +151,100 @@ DATABASES = {
         'HOST': env('DATABASE_HOST'),
         'USER': env('DATABASE_USER'),
         'PASSWORD': env('DATABASE_PASSWORD'),
-        'PORT': 5432
+        'PORT': 5432,
+        # Connections are checked before each reuse, so one the server dropped is replaced
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Connections are kept open across requests. Under ASGI every request runs in a
+# thread of its own, where per-thread persistent connections would never be
+# reused, so by default they come from a psycopg pool shared by the process.
+# With DATABASE_POOL=false (e.g. under a WSGI server) each thread keeps its
+# connection for DATABASE_CONN_MAX_AGE seconds instead.
+if env.bool('DATABASE_POOL', default=True):
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=10),
+        # Seconds a request waits for a free connection before failing
+        'timeout': 10,
+    }}
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DATABASE_CONN_MAX_AGE', default=60)
+
+# Read replicas, comma separated hosts with the primary's credentials; safe-method
+# requests read from them (see lib.routers)
+DATABASE_REPLICAS = []
+for number, host in enumerate(env.list('DATABASE_REPLICA_HOSTS', default=[]), start=1):
+    # Tests read the test copy of the primary rather than creating databases on a read-only host
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['lib.routers.PrimaryReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, to cover replication lag
+DATABASE_REPLICA_LAG = env.int('DATABASE_REPLICA_LAG', default=5)
+
+
+# Cache
+# Local memory (per process, LRU-culled past MAX_ENTRIES) unless CACHE_URL points at a shared backend,
+# e.g. redis://host:6379/1 with `maxmemory-policy allkeys-lru` in production
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://crisismap?max_entries=1000')
+}
+
+
+# ReliefWeb snapshots
+# When RELIEFWEB_SCHEDULER is on, each web process refreshes the pre-serialized disasters and stats payloads
+# every RELIEFWEB_SNAPSHOT_INTERVAL seconds (with jitter). A lease in the cache stops two workers refreshing at once,
+# so with several processes CACHE_URL must point at a shared backend
+
+RELIEFWEB_SCHEDULER = env.bool('RELIEFWEB_SCHEDULER', default=False)
+
+RELIEFWEB_SNAPSHOT_INTERVAL = env.int('RELIEFWEB_SNAPSHOT_INTERVAL', default=300)
+
+RELIEFWEB_SNAPSHOT_LEASE = env.int('RELIEFWEB_SNAPSHOT_LEASE', default=120)
+
+
+# ReliefWeb API
+# Calls are made under RELIEFWEB_APPNAME and limited per process to RELIEFWEB_RATE_LIMIT a minute,
+# with bursts of up to RELIEFWEB_RATE_BURST
+
+RELIEFWEB_API_URL = env('RELIEFWEB_API_URL', default='https://api.reliefweb.int/v2')
+
+RELIEFWEB_APPNAME = env('RELIEFWEB_APPNAME', default='CallumLiu-CrisisMap-CL96')
+
+RELIEFWEB_RATE_LIMIT = env.int('RELIEFWEB_RATE_LIMIT', default=30)
+
+RELIEFWEB_RATE_BURST = env.int('RELIEFWEB_RATE_BURST', default=10)
+
+
+# Comment streams
+# COMMENTS_BROKER fans new, edited and deleted comments out to the SSE streams. The in-memory broker only
+# reaches viewers connected to the same process, so run a single ASGI process with it. The Procfile pins
+# uvicorn to one worker (it would otherwise start $WEB_CONCURRENCY), which the local-memory cache needs too
+
+COMMENTS_BROKER = env('COMMENTS_BROKER', default='comments.broker.InMemoryBroker')
+
+COMMENTS_STREAM_HEARTBEAT = env.int('COMMENTS_STREAM_HEARTBEAT', default=15)
+
+
+# Metrics
+# Scrapers must send METRICS_TOKEN as a bearer token to read /metrics; without one it is only served in DEBUG
+
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Processes that hash and check passwords for login, registration and password
+# changes, so a burst of sign-ins doesn't hold up the web process; 0 hashes in a thread
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', default=2)
+
+# Hashing jobs queued or running at once; more are answered 503 rather than queued
+PASSWORD_HASH_MAX_PENDING = env.int('PASSWORD_HASH_MAX_PENDING', default=16)
+
+# Login and registration attempts allowed per client IP
+AUTH_THROTTLE_RATE = env('AUTH_THROTTLE_RATE', default='10/minute')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -16,10 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from lib.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/comments/', include('comments.urls')),
     path('api/reliefweb/', include('reliefweb.urls')),
+    path('api/search/', include('search.urls')),
+    path('metrics', metrics_view),
 ]
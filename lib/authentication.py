@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+# Seconds a full User row fetched for a token user is reused
+FULL_USER_TTL = 60
+
+
+def full_user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class ClaimsUser(TokenUser):
+    """
+    A user built from the token claims alone, with the id and username that
+    CustomTokenSerializer puts in the `user` claim. Enough for permission
+    checks and for writing comments without loading the User row.
+    """
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def username(self):
+        return self.token.get('user', {}).get('username', '')
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticates from the JWT claims, with the user as a ClaimsUser rather
+    than a User row. The row, read through get_full_user's cache, is still
+    checked: tokens of deactivated users are rejected, as simplejwt does,
+    and so are tokens issued before the password changed, whose `ver` claim
+    is behind User.token_version. A deleted user's row is gone, which
+    rejects theirs.
+    """
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+
+        full_user = get_full_user(user.id)
+        if api_settings.CHECK_USER_IS_ACTIVE and not full_user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        # Tokens from before versions were issued carry none, which is version 0
+        if validated_token.get('ver', 0) != full_user.token_version:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user
+
+
+def revoke_tokens(user_id):
+    """
+    Rejects every token already issued to the user, e.g. after a password
+    change, by moving their token version on.
+    """
+    get_user_model().objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+    forget_user(user_id)
+
+
+def get_full_user(user_id):
+    """
+    Returns the User model for a token user, for the read paths that need more
+    than the token claims and to check token versions. Cached for
+    FULL_USER_TTL seconds, so writes should load the row themselves.
+    """
+    user = cache.get(full_user_key(user_id))
+    if user is None:
+        try:
+            user = get_user_model().objects.get(pk=user_id)
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        cache.set(full_user_key(user_id), user, timeout=FULL_USER_TTL)
+    return user
+
+
+def forget_user(user_id):
+    cache.delete(full_user_key(user_id))
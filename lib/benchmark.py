@@ -0,0 +1,134 @@
+import json
+import math
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from lib.metrics import REQUEST_QUERIES
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Threshold keys that are floors rather than ceilings
+MINIMUMS = {'rps'}
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def query_totals(route):
+    series = REQUEST_QUERIES.series.get((route,))
+    if not series:
+        return 0, 0
+    return sum(series[:-1]), series[-1]
+
+
+def run_scenario(base_url, scenario, count, concurrency, warmup=0):
+    """
+    Sends `count` requests for one scenario from `concurrency` threads and
+    returns its throughput, latency percentiles in milliseconds, error count
+    and mean database queries per request. A scenario is a dict with a
+    `name`, `method`, `path`, optional JSON `data` and the `route` its view
+    is recorded under by the metrics middleware. A `background` scenario,
+    with its own `concurrency`, is sent in a loop for as long as this one
+    runs, to measure it under that load.
+    """
+    local = threading.local()
+
+    def send(request):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.request(
+            request.get('method', 'GET'), base_url + request['path'],
+            json=request.get('data'), headers=request.get('headers')
+        )
+        # Read the whole body, streamed or not, so the timing covers it
+        response.content
+        return time.perf_counter() - started, response.status_code
+
+    background = scenario.get('background')
+    finished = threading.Event()
+    background_sent = []
+
+    def load():
+        while not finished.is_set():
+            background_sent.append(send(background))
+
+    loaders = [threading.Thread(target=load, daemon=True) for _ in range(background['concurrency'] if background else 0)]
+    for loader in loaders:
+        loader.start()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: send(scenario), range(warmup)))
+            requests_before, queries_before = query_totals(scenario['route'])
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: send(scenario), range(count)))
+            elapsed = time.perf_counter() - started
+        requests_after, queries_after = query_totals(scenario['route'])
+    finally:
+        finished.set()
+        for loader in loaders:
+            loader.join()
+
+    latencies = sorted(duration * 1000 for duration, _ in results)
+    recorded = requests_after - requests_before
+    measured = {
+        'requests': count,
+        'errors': sum(1 for _, status in results if status >= 400),
+        'rps': round(count / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries': round((queries_after - queries_before) / recorded, 2) if recorded else None,
+    }
+    if background:
+        measured['background_requests'] = len(background_sent)
+        measured['background_errors'] = sum(1 for _, status in background_sent if status >= 400)
+    return measured
+
+
+def check_thresholds(results, thresholds):
+    """
+    Compares a results dict with a thresholds dict of the same shape and
+    returns a message for every value past its limit. Every limit is a
+    ceiling except the ones in MINIMUMS.
+    """
+    failures = []
+
+    def check(label, value, limit, minimum):
+        if value is None:
+            return
+        if (value < limit) if minimum else (value > limit):
+            failures.append(f"{label} is {value}, {'below' if minimum else 'above'} the threshold of {limit}")
+
+    for key, limit in thresholds.items():
+        if key == 'scenarios':
+            continue
+        check(key, results.get(key), limit, key in MINIMUMS)
+    for name, limits in thresholds.get('scenarios', {}).items():
+        measured = results['scenarios'].get(name)
+        if measured is None:
+            continue
+        for key, limit in limits.items():
+            check(f'{name}.{key}', measured.get(key), limit, key in MINIMUMS)
+    return failures
+
+
+def load_thresholds(path):
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from rest_framework.exceptions import APIException
+from lib.metrics import Collected, Counter, Histogram
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Jobs submitted and not finished yet, across threads and the event loop
+_pending = 0
+_pending_lock = threading.Lock()
+
+HASH_REJECTED = Counter('password_hash_rejected_total', 'Password hashing jobs turned away because too many were pending')
+HASH_POOL_BROKEN = Counter('password_hash_pool_broken_total', 'Times the password hashing pool was replaced after a worker died')
+HASH_DURATION = Histogram('password_hash_seconds', 'Time from submitting a password hashing job to its result, by operation', ['operation'])
+Collected('password_hash_pending', 'Password hashing jobs queued or running', lambda: {(): _pending})
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = 'Too many sign-ins right now, please try again in a moment.'
+    default_code = 'hashing_busy'
+
+
+def hash_in_worker(password):
+    return make_password(password)
+
+
+def check_in_worker(password, encoded):
+    """
+    Returns (is_correct, upgraded), where `upgraded` is the password hashed
+    again when its hasher or work factor is out of date, and None otherwise.
+    A missing or unusable `encoded` still costs one hash, like a real check.
+    """
+    # An empty hash is one verify_password can't identify, so it fakes the runtime
+    is_correct, must_update = verify_password(password, encoded or '')
+    return is_correct, make_password(password) if is_correct and must_update else None
+
+
+def setup_worker():
+    # Workers inherit the web process's environment, but only hash: they mustn't start its background jobs too
+    os.environ['RELIEFWEB_SCHEDULER'] = 'False'
+    django.setup()
+
+
+def get_pool():
+    """
+    Returns the process pool hashing runs in, started on first use, or None
+    when PASSWORD_HASH_WORKERS is 0 and hashing runs in a thread instead.
+    """
+    global _pool
+    if _pool is None and settings.PASSWORD_HASH_WORKERS:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned rather than forked, as forking a process that runs threads isn't safe
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=setup_worker
+                )
+    return _pool
+
+
+def discard_pool(pool):
+    """
+    Drops a pool that broke because a worker died (e.g. killed for memory),
+    so the next job starts a new one instead of failing like this one did.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            HASH_POOL_BROKEN.inc()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def admitted():
+    """
+    Holds one of the PASSWORD_HASH_MAX_PENDING hashing slots, raising
+    HashingBusy straight away when they are all taken, so a burst of sign-ins
+    is turned away rather than queued without limit.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            HASH_REJECTED.inc()
+            raise HashingBusy()
+        _pending += 1
+    try:
+        yield
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+async def run_async(operation, function, *args):
+    with admitted():
+        started = time.perf_counter()
+        pool = get_pool()
+        if pool:
+            try:
+                result = await asyncio.wrap_future(pool.submit(function, *args))
+            except BrokenProcessPool:
+                discard_pool(pool)
+                raise HashingBusy()
+        else:
+            result = await asyncio.to_thread(function, *args)
+        HASH_DURATION.observe(time.perf_counter() - started, operation)
+        return result
+
+
+async def ahash_password(password):
+    """
+    Hashes a password off the event loop, in the hashing pool.
+    """
+    return await run_async('hash', hash_in_worker, password)
+
+
+async def acheck_password(password, encoded):
+    """
+    Checks a password against its hash in the hashing pool, returning
+    (is_correct, upgraded) as check_in_worker does.
+    """
+    return await run_async('check', check_in_worker, password, encoded)
+
+
+def hash_password(password):
+    """
+    Hashes a password in the hashing pool, for sync code. The calling thread
+    waits, but the hashing itself doesn't hold this process's GIL.
+    """
+    with admitted():
+        started = time.perf_counter()
+        pool = get_pool()
+        try:
+            encoded = pool.submit(hash_in_worker, password).result() if pool else hash_in_worker(password)
+        except BrokenProcessPool:
+            discard_pool(pool)
+            raise HashingBusy()
+        HASH_DURATION.observe(time.perf_counter() - started, 'hash')
+        return encoded
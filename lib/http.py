@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+# Brotli is optional: without it responses are offered gzip only
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 200
+
+# Seconds a compressed variant stays cached; the key includes the ETag, so it never goes stale
+COMPRESSED_TTL = 60 * 60 * 24
+
+COMPRESSORS = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+}
+if brotli:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+# Preferred order when the client accepts several
+PREFERRED_ENCODINGS = ['br', 'gzip']
+
+
+def make_etag(body):
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def variant_etag(etag, encoding):
+    # A compressed variant is different bytes, so it gets its own strong ETag
+    return '%s-%s"' % (etag[:-1], encoding) if encoding else etag
+
+
+def matched_etag(request, etag, sent):
+    """
+    Returns the ETag to check If-None-Match against: the one the client sent
+    if it names any encoding of this body, since they all have the same content.
+    """
+    variants = {etag} | {variant_etag(etag, encoding) for encoding in COMPRESSORS}
+    for tag in parse_etags(request.headers.get('If-None-Match', '')):
+        if tag.removeprefix('W/') in variants:
+            return tag
+    return sent
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    for encoding in PREFERRED_ENCODINGS:
+        if encoding in COMPRESSORS and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+
+def compressed_body(body, etag, encoding):
+    """
+    Returns the body compressed with `encoding`, compressing it only the first
+    time each stored version (ETag) is asked for.
+    """
+    key = f'compressed:{encoding}:{etag}'
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = COMPRESSORS[encoding](body)
+        cache.set(key, compressed, timeout=COMPRESSED_TTL)
+    return compressed
+
+
+def payload_response(request, body, etag=None, last_modified=None, content_type='application/json'):
+    """
+    Sends an already encoded body with a strong ETag (and Last-Modified if given).
+    Answers 304 Not Modified when the client's If-None-Match or If-Modified-Since
+    still matches, and otherwise compresses the body as the client prefers.
+    Compressed variants get the ETag suffixed with their encoding. Only bodies
+    passed with their ETag, stored versions, have their variants cached; the
+    rest are built per request and compressed as they are sent.
+    """
+    stored = etag is not None
+    etag = etag or make_etag(body)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    encoding = choose_encoding(request) if len(body) >= MIN_COMPRESS_SIZE else None
+    sent_etag = variant_etag(etag, encoding)
+
+    not_modified = get_conditional_response(request, etag=matched_etag(request, etag, sent_etag), last_modified=timestamp)
+    if not_modified is not None:
+        if not_modified.status_code == 304:
+            not_modified['ETag'] = sent_etag
+            if timestamp:
+                not_modified['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(not_modified, ['Accept-Encoding'])
+        return not_modified
+
+    if encoding:
+        body = compressed_body(body, etag, encoding) if stored else COMPRESSORS[encoding](body)
+    response = HttpResponse(body, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = sent_etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class EventStreamSafeGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves Server-Sent Events alone: it would compress
+    each event separately, which EventSource can't read.
+    """
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,251 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+PREFIX = 'crisismap_'
+
+# Seconds; roughly doubling, from a cache hit up to a request that hit an upstream timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Queries per request
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = []
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """
+    Base class for a metric family. Series are keyed by a tuple of label
+    values, so callers must only pass labels with a small, fixed set of
+    values (routes, methods, statuses), never ids or raw paths.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.append(self)
+
+    def samples(self):
+        return []
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(names, values)} {value}')
+        return lines
+
+
+class Counter(Metric):
+    """
+    A count that only goes up. Increments are plain integer additions with
+    no lock: under the GIL a lost update needs two threads to interleave on
+    the same series, and a rare undercount is cheaper than a lock per request.
+    """
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        if labels not in self.values:
+            self.values.setdefault(labels, 0)
+        self.values[labels] += amount
+
+    def samples(self):
+        for values, value in list(self.values.items()):
+            yield '_total', self.labels, values, value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into fixed buckets. Each series is one list
+    allocated on first use, so observing a value allocates nothing.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            # One slot per bucket, one for +Inf, then the sum
+            series = self.series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for values, series in list(self.series.items()):
+            count = 0
+            for bound, observed in zip(self.buckets + ('+Inf',), series):
+                count += observed
+                yield '_bucket', self.labels + ('le',), values + (bound,), count
+            yield '_count', self.labels, values, count
+            yield '_sum', self.labels, values, series[-1]
+
+
+class Collected(Metric):
+    """
+    A metric read at scrape time from state kept elsewhere. `collect` returns
+    a dict of label value tuples to values.
+    """
+    def __init__(self, name, help, collect, labels=(), type='gauge'):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.type = type
+
+    def samples(self):
+        suffix = '_total' if self.type == 'counter' else ''
+        for values, value in self.collect().items():
+            yield suffix, self.labels, values, value
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to build a response, by route',
+    ['route', 'method', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request, by route',
+    ['route'], buckets=QUERY_BUCKETS
+)
+REQUEST_DB_TIME = Counter(
+    'http_request_db_seconds', 'Time spent in database queries, by route',
+    ['route']
+)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper that counts and times the queries of one request.
+    """
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+# The QueryTimer of the request being handled. A context variable rather than
+# a wrapper added per request, because under ASGI the queries run in
+# sync_to_async threads whose connections the middleware can't reach, and
+# context variables are copied into those threads
+_query_timer = ContextVar('query_timer', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    # First, so a connection opened inside an execute_wrapper() block doesn't
+    # have this popped off in place of that block's wrapper
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_queries)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='lib.metrics.install_query_timer')
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and database work for every request, labelled
+    with the URL pattern that matched rather than the path, so the number
+    of series stays fixed however many ids are requested. Runs in the async
+    chain on the ASGI server and in the sync one under WSGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was loaded missed the signal.
+        # Reads may go to a replica, so every database is timed
+        for database in connections.all():
+            install_query_timer(database)
+        queries = QueryTimer()
+        token = _query_timer.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryTimer()
+        token = _query_timer.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        route = '/' + match.route if match else 'unmatched'
+        REQUEST_DURATION.observe(elapsed, route, request.method, response.status_code)
+        REQUEST_QUERIES.observe(queries.count, route)
+        REQUEST_DB_TIME.inc(route, amount=queries.duration)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Serves every metric in the Prometheus text format. Scrapers must send
+    METRICS_TOKEN as a bearer token; without one set, only DEBUG serves it.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
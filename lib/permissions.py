@@ -1,13 +1,15 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+# Both checks compare ids, so they work for token users as well as User rows
+
 class CommentOwnerOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
             return True
-        return request.user == obj.author
+        return request.user.id == obj.author_id
     
 class IsUserItself(BasePermission): 
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
             return True
-        return request.user == obj
+        return request.user.id == obj.id
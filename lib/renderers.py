@@ -0,0 +1,82 @@
+import json
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from lib.http import make_etag
+
+# orjson is optional: without it everything is encoded by the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Seconds an encoded body stays cached; keys carry a data version, so this only bounds memory
+ENCODED_TTL = 60 * 60
+
+# U+2028 and U+2029 are valid JSON but end a line in JavaScript, so DRF escapes them
+LINE_SEPARATORS = [('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029')]
+
+_encoder = DjangoJSONEncoder()
+
+if orjson:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+    def dumps(value):
+        """
+        Encodes a value to compact UTF-8 JSON bytes. Types orjson doesn't
+        know (Decimal, lazy strings, timedelta...) go through DjangoJSONEncoder.
+        """
+        return orjson.dumps(value, default=_encoder.default, option=ORJSON_OPTIONS)
+else:
+    def dumps(value):
+        """
+        Encodes a value to compact UTF-8 JSON bytes.
+        """
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def cached_body(key, build, timeout=ENCODED_TTL):
+    """
+    Returns (body, etag) for the payload stored under `key`, calling `build`
+    and encoding its result only on a miss. Keys must change whenever the
+    payload would, so an unchanged payload is never built or encoded twice.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        body = dumps(build())
+        entry = {'body': body, 'etag': make_etag(body)}
+        cache.set(key, entry, timeout)
+    return entry['body'], entry['etag']
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    DRF renderer that encodes with orjson when it is installed. Indented
+    output for the browsable API still goes through the stock renderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, bytes):
+            # Already encoded
+            return data
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        body = dumps(data)
+        # isascii is much cheaper than searching the body, and most bodies are ASCII
+        if not body.isascii():
+            for separator, escaped in LINE_SEPARATORS:
+                body = body.replace(separator, escaped)
+        return body
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    Drop-in for JsonResponse that encodes with `dumps`, and sends bytes
+    that are already encoded as they are.
+    """
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=data if isinstance(data, bytes) else dumps(data), **kwargs)
@@ -0,0 +1,127 @@
+import random
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+# The replica picked for a request whose reads may lag behind the primary;
+# everything else (writes, management commands, background jobs) reads from the primary
+_read_replica = ContextVar('read_replica', default=None)
+
+
+def pinned_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def replicas():
+    return settings.DATABASE_REPLICAS
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary (`default`), and the reads of requests that
+    ReplicaRoutingMiddleware lets use them to the replica it picked for the
+    request.
+    """
+    def db_for_read(self, model, **hints):
+        return _read_replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def bearer_token(request):
+    """
+    Returns the request's access token, or None. The token is still
+    authenticated by the view; this only decides where reads go.
+    """
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        return AccessToken(header[len('Bearer '):])
+    except TokenError:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe-method requests read from the replicas, while keeping reads
+    consistent for users who have just written. Unsafe requests use the
+    primary throughout, and pin their user to it for
+    DATABASE_REPLICA_LAG seconds, so reads they make straight after, which
+    a lagging replica might not have caught up with yet, use it too. So do
+    requests with a token issued that recently, which covers reads right
+    after registering or logging in. The others each read from one randomly
+    picked replica, so their queries see a single point in its history. Runs in the async chain on the ASGI
+    server and in the sync one under WSGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def route(self, request):
+        """
+        Returns (user_id, write, primary), where `primary` is whether the
+        request must read from the primary before its user's pin is checked.
+        """
+        token = bearer_token(request)
+        user_id = token.get(api_settings.USER_ID_CLAIM) if token else None
+        write = request.method not in SAFE_METHODS
+        fresh = bool(token and time.time() - token.get('iat', 0) < settings.DATABASE_REPLICA_LAG)
+        return user_id, write, write or fresh
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+
+        user_id, write, primary = self.route(request)
+        if not primary and user_id:
+            primary = bool(cache.get(pinned_key(user_id)))
+
+        reset = _read_replica.set(None if primary else random.choice(replicas()))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_replica.reset(reset)
+
+        if write and user_id:
+            cache.set(pinned_key(user_id), True, settings.DATABASE_REPLICA_LAG)
+        return response
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+
+        user_id, write, primary = self.route(request)
+        if not primary and user_id:
+            primary = bool(await cache.aget(pinned_key(user_id)))
+
+        # Context variables are copied into the sync_to_async threads views run in
+        reset = _read_replica.set(None if primary else random.choice(replicas()))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_replica.reset(reset)
+
+        if write and user_id:
+            await cache.aset(pinned_key(user_id), True, settings.DATABASE_REPLICA_LAG)
+        return response
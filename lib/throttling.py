@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class AuthRateThrottle(SimpleRateThrottle):
+    """
+    Limits login and registration attempts per client IP to
+    AUTH_THROTTLE_RATE (e.g. '10/minute'); None turns the limit off.
+    """
+    scope = 'auth'
+
+    def get_rate(self):
+        return settings.AUTH_THROTTLE_RATE
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import Country, DisasterType, Disaster, DisasterChange, SyncState
 
 # Register your models here.
+
+admin.site.register(Country)
+admin.site.register(DisasterType)
+admin.site.register(Disaster)
+admin.site.register(DisasterChange)
+admin.site.register(SyncState)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ReliefwebConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reliefweb'
+
+    def ready(self):
+        if settings.RELIEFWEB_SCHEDULER:
+            from .snapshots import start_scheduler
+            start_scheduler()
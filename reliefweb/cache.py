@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+import time
+import requests
+from django.core.cache import cache
+from lib.metrics import Collected
+from .client import get_reliefweb_stats, executor, CALL_TIMEOUT
+
+# Seconds a cached response is served as fresh
+DEFAULT_TTL = 300
+
+# Seconds after that during which the stale response is still served while it is refreshed in the background
+DEFAULT_STALE_TTL = 900
+
+# Seconds the last good response is kept to fall back on while ReliefWeb is failing
+FALLBACK_TTL = 24 * 60 * 60
+
+# How long one worker may hold the fetch lock for a key before another one takes over
+LOCK_TIMEOUT = 30
+
+# How long a worker waits for another worker's in-flight fetch before fetching itself
+WAIT_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+# Hit/miss counters for this process
+counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0, 'fallbacks': 0}
+
+# A fixed set of locks shared out by key hash, so concurrent misses on one key
+# in this process wait for a single fetch without keeping a lock per key forever
+_key_locks = [threading.Lock() for _ in range(64)]
+_refreshing = set()
+_refreshing_guard = threading.Lock()
+
+
+Collected(
+    'reliefweb_cache_lookups', 'ReliefWeb query cache lookups in this process, by result',
+    lambda: {(result,): counters[result] for result in ('hits', 'stale_hits', 'misses', 'fallbacks')},
+    labels=['result'], type='counter'
+)
+Collected(
+    'reliefweb_cache_hit_ratio', 'Share of ReliefWeb query cache lookups answered from the cache',
+    lambda: {(): cache_stats()['hit_ratio']}
+)
+
+
+def make_key(query):
+    """
+    Returns the cache key for a query: a hash of its canonical JSON form,
+    so dicts with the same content share an entry whatever their key order.
+    """
+    canonical = json.dumps(query, sort_keys=True, separators=(',', ':'))
+    return 'reliefweb:' + hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def cache_stats():
+    lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+    return {
+        **counters,
+        'hit_ratio': (counters['hits'] + counters['stale_hits']) / lookups if lookups else 0.0
+    }
+
+
+def store(key, value, ttl, stale_ttl):
+    entry = {'value': value, 'fresh_until': time.time() + ttl}
+    # The backend evicts the entry once the stale window is over (and LRU-culls it before that if full)
+    cache.set(key, entry, timeout=ttl + stale_ttl)
+    cache.set(key + ':last', value, timeout=FALLBACK_TTL)
+
+
+def fetch_and_store(key, query, ttl, stale_ttl, timeout):
+    value = get_reliefweb_stats(query, timeout=timeout)
+    store(key, value, ttl, stale_ttl)
+    return value
+
+
+def wait_for_entry(key):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry and time.time() < entry['fresh_until']:
+            return entry
+        if not cache.get(key + ':lock'):
+            return None
+    return None
+
+
+def load(key, query, ttl, stale_ttl, timeout):
+    """
+    Fetches a missing key, making sure only one fetch per key is in flight:
+    threads in this process queue on the key lock, and other processes wait
+    on a lock entry in the shared cache.
+    """
+    with _key_locks[hash(key) % len(_key_locks)]:
+        entry = cache.get(key)
+        if entry and time.time() < entry['fresh_until']:
+            counters['coalesced'] += 1
+            return entry['value']
+
+        lock_key = key + ':lock'
+        if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            entry = wait_for_entry(key)
+            if entry:
+                counters['coalesced'] += 1
+                return entry['value']
+        try:
+            return fetch_and_store(key, query, ttl, stale_ttl, timeout)
+        finally:
+            cache.delete(lock_key)
+
+
+def refresh(key, query, ttl, stale_ttl, timeout):
+    try:
+        if cache.add(key + ':lock', 1, timeout=LOCK_TIMEOUT):
+            try:
+                fetch_and_store(key, query, ttl, stale_ttl, timeout)
+                counters['refreshes'] += 1
+            finally:
+                cache.delete(key + ':lock')
+    finally:
+        with _refreshing_guard:
+            _refreshing.discard(key)
+
+
+def refresh_in_background(key, query, ttl, stale_ttl, timeout):
+    with _refreshing_guard:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    executor.submit(refresh, key, query, ttl, stale_ttl, timeout)
+
+
+def cached_reliefweb_result(query, timeout=CALL_TIMEOUT, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL):
+    """
+    get_reliefweb_stats backed by Django's cache, returning (value, stale).
+    Fresh entries are returned directly, stale ones are returned while a
+    background refresh runs, and misses are fetched once however many
+    requests ask for the same query at the same time. If a miss can't be
+    fetched, the last good response is returned as stale instead, so one
+    upstream outage doesn't blank out a query that was answered before.
+    Raises only when there is nothing to fall back on.
+    """
+    key = make_key(query)
+    entry = cache.get(key)
+
+    if entry and time.time() < entry['fresh_until']:
+        counters['hits'] += 1
+        return entry['value'], False
+
+    if entry:
+        counters['stale_hits'] += 1
+        refresh_in_background(key, query, ttl, stale_ttl, timeout)
+        return entry['value'], True
+
+    counters['misses'] += 1
+    try:
+        return load(key, query, ttl, stale_ttl, timeout), False
+    except requests.RequestException:
+        last = cache.get(key + ':last')
+        if last is None:
+            raise
+        counters['fallbacks'] += 1
+        return last, True
+
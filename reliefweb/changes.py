@@ -0,0 +1,96 @@
+from django.db.models import Max, Min
+from rest_framework.exceptions import ValidationError
+from lib.pagination import encode_cursor, decode_cursor
+from .listing import DEFAULT_FIELDS
+from .models import Disaster, DisasterChange, SyncState
+from .serializers.common import DisasterSerializer
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+
+class TokenExpired(Exception):
+    """
+    The changes after a token are no longer all in the log.
+    """
+
+
+def make_token(version):
+    return encode_cursor([version])
+
+
+def parse_changes_params(params):
+    since = params.get('since')
+    version = None
+    if since:
+        try:
+            version = decode_cursor(since, 1)[0]
+        except ValidationError:
+            raise ValidationError({ 'since': 'Invalid token' })
+        if not isinstance(version, int):
+            raise ValidationError({ 'since': 'Invalid token' })
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError({ 'limit': 'Must be a number' })
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({ 'limit': f'Must be between 1 and {MAX_LIMIT}' })
+
+    return {'since': version, 'limit': limit}
+
+
+def disaster_changes(options):
+    """
+    Returns the disasters created, updated or closed after the `since` token,
+    each once in its current state with the first action seen for it, plus
+    the token to poll from next. Without a token nothing is returned but the
+    current token, which is where a client that has just loaded the list
+    starts from. Raises TokenExpired when changes after the token have been
+    pruned from the log, in which case the client reloads the list.
+    """
+    pruned_through = SyncState.objects.filter(resource='disasters').values_list('pruned_through', flat=True).first() or 0
+    if options['since'] is None:
+        # Never behind what was pruned, even when that was the whole log
+        latest = max(DisasterChange.objects.aggregate(version=Max('id'))['version'] or 0, pruned_through)
+        return {'token': make_token(latest), 'more': False, 'count': 0, 'data': []}
+
+    since = options['since']
+    # Changes after a token from before the pruning mark are gone, whether or
+    # not the log still has rows
+    if since < pruned_through:
+        raise TokenExpired()
+    versions = DisasterChange.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+    # A gap below the oldest kept version means changes after the token were
+    # deleted, and a token past the latest one comes from a log that was reset
+    if versions['oldest'] is not None and not versions['oldest'] - 1 <= since <= versions['latest']:
+        raise TokenExpired()
+
+    page = list(
+        DisasterChange.objects.filter(id__gt=since).order_by('id').values_list('id', 'disaster_id', 'action')[:options['limit'] + 1]
+    )
+    more = len(page) > options['limit']
+    page = page[:options['limit']]
+
+    actions = {}
+    for _, disaster_id, action in page:
+        # Created then updated within the window is still new to this client
+        actions.setdefault(disaster_id, action)
+        if action == DisasterChange.CLOSED and actions[disaster_id] == DisasterChange.UPDATED:
+            actions[disaster_id] = action
+
+    disasters = Disaster.objects.filter(id__in=actions).select_related(
+        'primary_country', 'primary_type'
+    ).prefetch_related('countries', 'types').defer('description').order_by('id')
+    # The same fields as the default list the client is keeping up to date
+    data = [
+        {**item, 'change': actions[int(item['id'])]}
+        for item in DisasterSerializer(disasters, many=True, fields=DEFAULT_FIELDS).data
+    ]
+    return {
+        'token': make_token(page[-1][0] if page else since),
+        'more': more,
+        'count': len(data),
+        'data': data,
+    }
+
@@ -0,0 +1,241 @@
+import random
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from lib.metrics import Collected, Counter, Histogram
+
+# (connect, read) timeout for a single upstream call, in seconds
+CALL_TIMEOUT = (3.05, 8)
+
+# Overall budget for work run concurrently on the executor, in seconds
+BATCH_DEADLINE = 10
+
+MAX_CONNECTIONS = 8
+
+# Retries: at most this many attempts per call, with full-jitter exponential backoff,
+# and never more retries than RETRY_RATIO of the calls made recently
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2
+RETRY_RATIO = 0.2
+
+# Consecutive failures that open the circuit, and how long it stays open, in seconds
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+# How long a call may wait for a rate limit token, in seconds
+RATE_LIMIT_WAIT = 1
+
+# Statuses worth another attempt; any other 4xx is our fault and is raised straight away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ReliefWebUnavailable(requests.RequestException):
+    """
+    Raised without calling ReliefWeb, when the circuit is open or our rate limit is used up.
+    """
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average, with bursts of up to `capacity`.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            wait_for = self.try_acquire()
+            if not wait_for:
+                return True
+            if time.monotonic() + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+class RetryBudget:
+    """
+    Every call deposits `ratio` of a retry and every retry spends a whole one,
+    so retries stay a small share of the traffic instead of multiplying it
+    while the upstream is struggling.
+    """
+    def __init__(self, ratio, minimum=3, maximum=10):
+        self.ratio = ratio
+        self.balance = minimum
+        self.maximum = maximum
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.balance = min(self.maximum, self.balance + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.balance >= 1:
+                self.balance -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and fails calls fast for
+    `reset_timeout` seconds. Then one trial call is let through: success
+    closes the circuit, failure opens it again.
+    """
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    @property
+    def is_failing(self):
+        # The last call (or trial call) to ReliefWeb failed
+        return self.failures > 0
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.is_open or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+# One keep-alive session shared by every request, so calls reuse pooled TLS connections
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS))
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS))
+
+executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='reliefweb')
+
+rate_limiter = TokenBucket(settings.RELIEFWEB_RATE_LIMIT / 60, capacity=settings.RELIEFWEB_RATE_BURST)
+retry_budget = RetryBudget(RETRY_RATIO)
+breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+
+
+UPSTREAM_DURATION = Histogram(
+    'reliefweb_request_duration_seconds', 'Time spent in ReliefWeb API calls, by response status',
+    ['status']
+)
+UPSTREAM_REJECTED = Counter(
+    'reliefweb_rejected_calls', 'ReliefWeb calls refused before being made',
+    ['reason']
+)
+Collected(
+    'reliefweb_circuit_open', 'Whether the ReliefWeb circuit breaker is open',
+    lambda: {(): int(breaker.is_open)}
+)
+
+
+def disasters_url():
+    # Base URL with appname query string explicitly included
+    return f'{settings.RELIEFWEB_API_URL}/disasters?appname={settings.RELIEFWEB_APPNAME}'
+
+
+def is_retryable(error):
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in RETRY_STATUSES
+
+
+def backoff(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def post(query, timeout):
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        response = session.post(
+            disasters_url(),
+            json=query,
+            headers={'User-Agent': settings.RELIEFWEB_APPNAME},
+            timeout=timeout
+        )
+        status = response.status_code
+        return response
+    except requests.Timeout:
+        status = 'timeout'
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started, status)
+
+
+def get_reliefweb_stats(query, timeout=CALL_TIMEOUT):
+    """
+    Makes a POST request to ReliefWeb API with a query JSON.
+    Returns the decoded response, a dict with at least 'data' and 'totalCount'.
+    Transient failures are retried within the retry budget. Raises
+    requests.RequestException if the call fails, or ReliefWebUnavailable
+    straight away while the circuit is open or the rate limit is used up.
+    """
+    if not rate_limiter.acquire(RATE_LIMIT_WAIT):
+        UPSTREAM_REJECTED.inc('rate_limited')
+        raise ReliefWebUnavailable('ReliefWeb rate limit reached')
+    if not breaker.allow():
+        UPSTREAM_REJECTED.inc('circuit_open')
+        raise ReliefWebUnavailable('ReliefWeb is unavailable, not retrying until the circuit closes')
+    retry_budget.deposit()
+
+    attempt = 1
+    while True:
+        try:
+            response = post(query, timeout)
+            response.raise_for_status()
+            result = response.json()
+        except requests.RequestException as error:
+            if not is_retryable(error):
+                # A 4xx other than 429 is a bad query, not a sign the upstream is down
+                breaker.record_success()
+                raise
+            if (attempt < MAX_ATTEMPTS and retry_budget.withdraw()
+                    and rate_limiter.acquire(RATE_LIMIT_WAIT)):
+                time.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
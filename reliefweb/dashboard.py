@@ -0,0 +1,106 @@
+import requests
+from concurrent.futures import TimeoutError
+from django.core.cache import cache
+from django.db import close_old_connections
+from rest_framework.exceptions import ValidationError
+from lib.pagination import KeysetPagination
+from lib.renderers import dumps
+from comments.models import Comment, EventCommentCount
+from comments.serializers.common import CommentSerializer
+from .client import BATCH_DEADLINE, executor
+from .listing import DEFAULT_LIMIT, ORDERING, split_param
+from .models import Disaster
+from .snapshots import get_snapshot, snapshot_key
+
+SECTIONS = ['disasters', 'stats', 'counts', 'comments']
+DEFAULT_SECTIONS = ['disasters', 'stats', 'counts']
+
+
+def parse_dashboard_params(params):
+    event = params.get('event')
+    if event is not None:
+        try:
+            event = int(event)
+        except ValueError:
+            raise ValidationError({ 'event': 'Must be a ReliefWeb event ID' })
+
+    sections = split_param(params, 'sections')
+    if not sections:
+        sections = DEFAULT_SECTIONS + (['comments'] if event is not None else [])
+    unknown = [section for section in sections if section not in SECTIONS]
+    if unknown:
+        raise ValidationError({ 'sections': f"Unknown sections: {', '.join(unknown)}. Allowed: {', '.join(SECTIONS)}" })
+    if 'comments' in sections and event is None:
+        raise ValidationError({ 'event': 'Required for the comments section' })
+
+    return {'sections': list(dict.fromkeys(sections)), 'event': event}
+
+
+def build_snapshot_body(name):
+    try:
+        return get_snapshot(name)['body']
+    finally:
+        # Runs on an executor thread, which keeps its own connection
+        close_old_connections()
+
+
+def latest_disaster_ids():
+    # The same rows, in the same order, as the first page of the disasters section
+    return list(
+        Disaster.objects.filter(date_created__isnull=False)
+        .order_by(*[f'-{field}' for field in ORDERING])
+        .values_list('id', flat=True)[:DEFAULT_LIMIT]
+    )
+
+
+def comment_counts(events):
+    counts = dict.fromkeys(events, 0)
+    counts.update(EventCommentCount.objects.filter(event__in=events).values_list('event', 'count'))
+    return {str(event): count for event, count in counts.items()}
+
+
+def latest_comments(request, event):
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(Comment.objects.select_related('author').filter(event=event), request)
+    # The cursor continues at /api/comments/?event=<event>&cursor=<cursor>
+    return {'cursor': paginator.next_cursor, 'results': CommentSerializer(page, many=True).data}
+
+
+def build_dashboard(request, options):
+    """
+    Assembles the requested sections into one JSON body. A stats snapshot
+    that isn't built yet has to go upstream, so it is built on the executor
+    while the database sections run here. Snapshots are spliced in as the
+    bytes they are stored as, without decoding them. A section that fails
+    is null and its error is listed under `errors`.
+    """
+    sections = options['sections']
+    parts, errors = {}, {}
+    stats = None
+    if 'stats' in sections:
+        snapshot = cache.get(snapshot_key('stats'))
+        if snapshot:
+            parts['stats'] = snapshot['body']
+        else:
+            stats = executor.submit(build_snapshot_body, 'stats')
+
+    if 'disasters' in sections:
+        parts['disasters'] = get_snapshot('disasters')['body']
+    if 'counts' in sections:
+        parts['counts'] = dumps(comment_counts(latest_disaster_ids()))
+    if 'comments' in sections:
+        parts['comments'] = dumps(latest_comments(request, options['event']))
+
+    if stats:
+        try:
+            parts['stats'] = stats.result(timeout=BATCH_DEADLINE)
+        except TimeoutError:
+            errors['stats'] = 'Timed out'
+        except requests.RequestException as error:
+            errors['stats'] = str(error)
+
+    body = [b'{']
+    for section in sections:
+        body += [dumps(section), b':', parts.get(section, b'null'), b',']
+    body += [b'"errors":', dumps(errors), b'}']
+    return b''.join(body)
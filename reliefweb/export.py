@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import ValidationError
+from lib.pagination import encode_cursor, decode_cursor
+from .models import Disaster
+from .serializers.common import DisasterSerializer
+
+OUTPUTS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_COLUMNS = [
+    'id', 'name', 'status', 'url', 'date_event', 'date_created', 'date_changed',
+    'primary_country', 'primary_country_name', 'countries', 'primary_type', 'types',
+    'description', 'cursor'
+]
+
+# Rows fetched per database round trip
+ROWS_PER_FETCH = 500
+
+# Bytes buffered before a chunk is handed to the client
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_export_params(params):
+    output = params.get('output', 'ndjson')
+    if output not in OUTPUTS:
+        raise ValidationError({ 'output': f"Must be one of: {', '.join(OUTPUTS)}" })
+
+    after = None
+    if params.get('after'):
+        try:
+            after = decode_cursor(params['after'], 1)[0]
+        except ValidationError:
+            after = None
+        # bool is an int subclass, so compare the type exactly
+        if type(after) is not int:
+            raise ValidationError({ 'after': 'Invalid cursor' })
+    return {'output': output, 'after': after}
+
+
+def export_queryset(after=None):
+    # Ascending ids give a stable order to resume from
+    disasters = Disaster.objects.select_related(
+        'primary_country', 'primary_type'
+    ).prefetch_related(
+        'countries', 'types'
+    ).order_by('id')
+    if after is not None:
+        disasters = disasters.filter(id__gt=after)
+    return disasters
+
+
+def ndjson_lines(disasters):
+    for disaster in disasters:
+        item = DisasterSerializer(disaster).data
+        item['cursor'] = encode_cursor([disaster.id])
+        yield json.dumps(item, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(disasters, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    if header:
+        writer.writerow(CSV_COLUMNS)
+        yield flush()
+    for disaster in disasters:
+        country, disaster_type = disaster.primary_country, disaster.primary_type
+        writer.writerow([
+            disaster.id,
+            disaster.name,
+            disaster.status,
+            disaster.url,
+            disaster.date_event.isoformat() if disaster.date_event else '',
+            disaster.date_created.isoformat() if disaster.date_created else '',
+            disaster.date_changed.isoformat() if disaster.date_changed else '',
+            country.iso3 if country else '',
+            country.name if country else '',
+            ';'.join(c.iso3 for c in disaster.countries.all()),
+            disaster_type.name if disaster_type else '',
+            ';'.join(t.name for t in disaster.types.all()),
+            disaster.description,
+            encode_cursor([disaster.id]),
+        ])
+        yield flush()
+
+
+def export_disasters(output='ndjson', after=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields the whole disaster history as NDJSON or CSV in chunks of about
+    `chunk_size` bytes. Rows are read through a server-side cursor, so memory
+    use stays flat however big the store is. Every record carries a `cursor`;
+    pass the last one received as `after` to resume an interrupted export.
+    """
+    disasters = export_queryset(after).iterator(chunk_size=ROWS_PER_FETCH)
+    # A resumed CSV export continues the earlier file, so it has no header row
+    lines = ndjson_lines(disasters) if output == 'ndjson' else csv_lines(disasters, header=after is None)
+
+    chunk, size = [], 0
+    for line in lines:
+        encoded = line.encode()
+        chunk.append(encoded)
+        size += len(encoded)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+async def aexport_disasters(*args, **kwargs):
+    """
+    export_disasters for the ASGI server, which would read a sync iterator
+    into memory whole before sending the first byte. Each chunk is made in
+    Django's sync thread, where the database cursor lives.
+    """
+    chunks = export_disasters(*args, **kwargs)
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # Releases the server-side cursor when the client goes away mid-export
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,255 @@
+import math
+from django.core.cache import cache
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from lib.renderers import ENCODED_TTL
+from .cache import make_key
+from .listing import parse_listing_params, matching_disasters
+from .sync import data_version
+
+LAYERS = ['countries', 'clusters']
+DEFAULT_LAYER = 'countries'
+
+# Listing filters the map layers accept
+FILTERS = ['type', 'country', 'status', 'from', 'to']
+
+# Web Mercator stops at these latitudes
+MAX_LATITUDE = 85.0511287798
+WORLD = (-180.0, -MAX_LATITUDE, 180.0, MAX_LATITUDE)
+
+# Disasters are placed at their country's centroid, so zooming further in splits nothing more
+MAX_ZOOM = 10
+
+# Each tile is split into 2**CELL_BITS by 2**CELL_BITS grid cells, 64px apart on a 256px tile
+CELL_BITS = 2
+
+# Tiles one clusters request may cover, enough for a large screen
+MAX_TILES = 64
+
+
+def parse_map_params(params):
+    """
+    Validates the map layer, the listing filters, `zoom` and `bbox`
+    (min longitude, min latitude, max longitude, max latitude).
+    """
+    layer = params.get('layer', DEFAULT_LAYER)
+    if layer not in LAYERS:
+        raise ValidationError({ 'layer': f"Must be one of: {', '.join(LAYERS)}" })
+
+    raw_filters = {name: params[name] for name in FILTERS if params.get(name)}
+    filters = parse_listing_params(raw_filters)
+
+    try:
+        zoom = int(params.get('zoom', 0))
+    except ValueError:
+        raise ValidationError({ 'zoom': 'Must be a number' })
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValidationError({ 'zoom': f'Must be between 0 and {MAX_ZOOM}' })
+
+    bbox = WORLD
+    if params.get('bbox'):
+        try:
+            bbox = tuple(float(value) for value in params['bbox'].split(','))
+        except ValueError:
+            raise ValidationError({ 'bbox': 'Must be four numbers' })
+        if len(bbox) != 4:
+            raise ValidationError({ 'bbox': 'Must be four numbers' })
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+            raise ValidationError({ 'bbox': 'Must be longitudes and latitudes in degrees' })
+        if min_lon > max_lon or min_lat > max_lat:
+            # A box across the antimeridian has to be asked for as two
+            raise ValidationError({ 'bbox': 'Minimums must not be above maximums' })
+
+    tiles = tile_range(bbox, zoom)
+    if layer == 'clusters' and len(tiles) > MAX_TILES:
+        raise ValidationError({ 'bbox': f'Covers more than {MAX_TILES} tiles at this zoom' })
+
+    return {
+        'layer': layer,
+        'filters': filters,
+        # Dates don't go into cache keys, so those use the parameters as given
+        'filters_key': sorted(raw_filters.items()),
+        'zoom': zoom,
+        'bbox': bbox,
+        'tiles': tiles,
+    }
+
+
+def tile_xy(lon, lat, zoom):
+    """
+    Returns the x, y of the Web Mercator tile at `zoom` that contains a point.
+    """
+    n = 2 ** zoom
+    lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_range(bbox, zoom):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    # Tile rows count down from the north
+    x0, y0 = tile_xy(min_lon, max_lat, zoom)
+    x1, y1 = tile_xy(max_lon, min_lat, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def country_aggregates(options):
+    """
+    Returns the disaster counts of every country, by type and status, with
+    the country's centroid, plus the count of disasters without a located
+    primary country. Built in one grouped query per store version and filters.
+    """
+    key = make_key({'view': 'map-countries', 'version': data_version(), 'filters': options['filters_key']})
+    aggregates = cache.get(key)
+    if aggregates is not None:
+        return aggregates
+
+    rows = (
+        matching_disasters(options['filters'])
+        .values(
+            'primary_country__iso3', 'primary_country__name',
+            'primary_country__latitude', 'primary_country__longitude',
+            'primary_type__name', 'status'
+        )
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    countries, unlocated = {}, 0
+    for row in rows:
+        lat, lon = row['primary_country__latitude'], row['primary_country__longitude']
+        if lat is None or lon is None:
+            unlocated += row['count']
+            continue
+        iso3 = row['primary_country__iso3']
+        country = countries.setdefault(iso3, {
+            'iso3': iso3,
+            'name': row['primary_country__name'],
+            'lon': lon,
+            'lat': lat,
+            'count': 0,
+            'types': {},
+            'statuses': {},
+        })
+        country['count'] += row['count']
+        if row['primary_type__name']:
+            country['types'][row['primary_type__name']] = country['types'].get(row['primary_type__name'], 0) + row['count']
+        country['statuses'][row['status']] = country['statuses'].get(row['status'], 0) + row['count']
+
+    aggregates = {'countries': sorted(countries.values(), key=lambda country: country['iso3']), 'unlocated': unlocated}
+    cache.set(key, aggregates, ENCODED_TTL)
+    return aggregates
+
+
+def point(lon, lat):
+    return {'type': 'Point', 'coordinates': [round(lon, 5), round(lat, 5)]}
+
+
+def merge_counts(total, counts):
+    for name, count in counts.items():
+        total[name] = total.get(name, 0) + count
+
+
+def country_layer(options):
+    """
+    Returns a GeoJSON FeatureCollection with one point per country in the
+    bounding box, carrying its disaster counts.
+    """
+    aggregates = country_aggregates(options)
+    min_lon, min_lat, max_lon, max_lat = options['bbox']
+    features = [
+        {
+            'type': 'Feature',
+            'id': country['iso3'],
+            'geometry': point(country['lon'], country['lat']),
+            'properties': {
+                'iso3': country['iso3'],
+                'name': country['name'],
+                'count': country['count'],
+                'types': country['types'],
+                'statuses': country['statuses'],
+            }
+        }
+        for country in aggregates['countries']
+        if min_lon <= country['lon'] <= max_lon and min_lat <= country['lat'] <= max_lat
+    ]
+    return {
+        'type': 'FeatureCollection',
+        'layer': 'countries',
+        'total': sum(feature['properties']['count'] for feature in features),
+        'unlocated': aggregates['unlocated'],
+        'features': features,
+    }
+
+
+def build_tiles(countries, zoom, tiles):
+    """
+    Clusters the countries that fall in each of `tiles` by grid cell.
+    Returns a dict of tile to its list of cluster features.
+    """
+    cells = {}
+    for country in countries:
+        x, y = tile_xy(country['lon'], country['lat'], zoom + CELL_BITS)
+        tile = (x >> CELL_BITS, y >> CELL_BITS)
+        if tile in tiles:
+            cells.setdefault(tile, {}).setdefault((x, y), []).append(country)
+
+    built = {tile: [] for tile in tiles}
+    for tile, tile_cells in cells.items():
+        for (x, y), members in sorted(tile_cells.items()):
+            count = sum(member['count'] for member in members)
+            types, statuses = {}, {}
+            for member in members:
+                merge_counts(types, member['types'])
+                merge_counts(statuses, member['statuses'])
+            built[tile].append({
+                'type': 'Feature',
+                'id': f'{zoom}/{x}/{y}',
+                'geometry': point(
+                    # Weighted by count, so the marker sits nearest where most disasters are
+                    sum(member['lon'] * member['count'] for member in members) / count,
+                    sum(member['lat'] * member['count'] for member in members) / count,
+                ),
+                'properties': {
+                    'count': count,
+                    'countries': [member['iso3'] for member in members],
+                    'types': types,
+                    'statuses': statuses,
+                }
+            })
+    return built
+
+
+def cluster_layer(options):
+    """
+    Returns a GeoJSON FeatureCollection of disaster clusters, one per grid
+    cell, for every tile the bounding box touches at `zoom`. Tiles are
+    cached separately, so a pan only builds the tiles it newly shows.
+    """
+    zoom = options['zoom']
+    version = data_version()
+    keys = {
+        tile: make_key({
+            'view': 'map-tile', 'version': version, 'filters': options['filters_key'],
+            'zoom': zoom, 'x': tile[0], 'y': tile[1]
+        })
+        for tile in options['tiles']
+    }
+    cached = cache.get_many(keys.values())
+    tiles = {tile: cached[key] for tile, key in keys.items() if key in cached}
+
+    missing = set(keys) - set(tiles)
+    if missing:
+        built = build_tiles(country_aggregates(options)['countries'], zoom, missing)
+        cache.set_many({keys[tile]: features for tile, features in built.items()}, ENCODED_TTL)
+        tiles.update(built)
+
+    features = [feature for tile in options['tiles'] for feature in tiles[tile]]
+    return {
+        'type': 'FeatureCollection',
+        'layer': 'clusters',
+        'zoom': zoom,
+        'total': sum(feature['properties']['count'] for feature in features),
+        'features': features,
+    }
@@ -0,0 +1,153 @@
+from datetime import datetime, time, timedelta, timezone
+from functools import reduce
+from operator import or_
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from lib.pagination import encode_cursor, decode_position, keyset_filter
+from .models import Country, DisasterType, Disaster
+from .serializers.common import DisasterSerializer
+
+# Fields a client may ask for, and the model columns / relations each one needs
+FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'status': ['status'],
+    'url': ['url'],
+    'summary': ['summary'],
+    'description': ['description'],
+    'date': ['date_event', 'date_created', 'date_changed'],
+    'primary_country': ['primary_country'],
+    'primary_type': ['primary_type'],
+    'country': [],
+    'type': [],
+}
+# Descriptions are long, so lists carry the summary unless asked for them
+DEFAULT_FIELDS = [
+    'id', 'name', 'status', 'primary_country', 'country',
+    'primary_type', 'type', 'url', 'date', 'summary'
+]
+STATUSES = ['alert', 'current', 'past']
+
+# Newest first, ties broken by id
+ORDERING = ('date_created', 'id')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def split_param(params, name):
+    return [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+
+
+def parse_listing_params(params):
+    """
+    Validates the disaster listing query parameters against their whitelists.
+    """
+    fields = split_param(params, 'fields') or DEFAULT_FIELDS
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValidationError({ 'fields': f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(FIELDS)}" })
+
+    statuses = split_param(params, 'status')
+    if any(status not in STATUSES for status in statuses):
+        raise ValidationError({ 'status': f"Must be one of: {', '.join(STATUSES)}" })
+
+    dates = {}
+    for name in ('from', 'to'):
+        if params.get(name):
+            dates[name] = parse_date(params[name])
+            if not dates[name]:
+                raise ValidationError({ name: 'Must be a date in YYYY-MM-DD format' })
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError({ 'limit': 'Must be a number' })
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({ 'limit': f'Must be between 1 and {MAX_LIMIT}' })
+
+    cursor = params.get('cursor')
+    return {
+        'fields': ['id'] + [field for field in fields if field != 'id'],
+        'types': split_param(params, 'type'),
+        'countries': [iso3.upper() for iso3 in split_param(params, 'country')],
+        'statuses': statuses,
+        'from': dates.get('from'),
+        'to': dates.get('to'),
+        'limit': limit,
+        'cursor': decode_position(cursor) if cursor else None,
+    }
+
+
+def matching_disasters(options):
+    """
+    Returns the disasters matching the type, country, status and date filters.
+    """
+    disasters = Disaster.objects.filter(date_created__isnull=False)
+
+    if options['types']:
+        # Match a type code (FL) or name (Flood) against any of the disaster's types
+        matching = DisasterType.objects.filter(
+            reduce(or_, [Q(code__iexact=value) | Q(name__iexact=value) for value in options['types']])
+        )
+        disasters = disasters.filter(id__in=Disaster.types.through.objects.filter(
+            disastertype__in=matching
+        ).values('disaster_id'))
+    if options['countries']:
+        disasters = disasters.filter(id__in=Disaster.countries.through.objects.filter(
+            country__in=Country.objects.filter(iso3__in=options['countries'])
+        ).values('disaster_id'))
+    if options['statuses']:
+        disasters = disasters.filter(status__in=options['statuses'])
+    # Compared as datetimes rather than __date so the date_created index is used
+    if options['from']:
+        disasters = disasters.filter(date_created__gte=datetime.combine(options['from'], time.min, tzinfo=timezone.utc))
+    if options['to']:
+        disasters = disasters.filter(date_created__lt=datetime.combine(options['to'] + timedelta(days=1), time.min, tzinfo=timezone.utc))
+    return disasters
+
+
+def filter_disasters(options):
+    """
+    Builds the queryset for the listing, loading only the columns and
+    relations the requested fields need.
+    """
+    fields = options['fields']
+    disasters = matching_disasters(options)
+    columns = {'date_created'} | {column for field in fields for column in FIELDS[field]}
+    related = [column for column in ('primary_country', 'primary_type') if column in columns]
+    disasters = disasters.select_related(*related).only(*columns)
+    if 'country' in fields:
+        disasters = disasters.prefetch_related('countries')
+    if 'type' in fields:
+        disasters = disasters.prefetch_related('types')
+    return disasters
+
+
+def disaster_listing(options):
+    """
+    Returns one page of the listing in the ReliefWeb response shape, plus the
+    cursor for the next page.
+    """
+    disasters = filter_disasters(options)
+    total = disasters.count()
+
+    page = disasters.order_by(*[f'-{field}' for field in ORDERING])
+    if options['cursor']:
+        page = page.filter(keyset_filter(ORDERING, options['cursor']))
+    page = list(page[:options['limit'] + 1])
+
+    next_cursor = None
+    if len(page) > options['limit']:
+        last = page[options['limit'] - 1]
+        next_cursor = encode_cursor([last.date_created.isoformat(), last.id])
+        page = page[:options['limit']]
+
+    data = DisasterSerializer(page, many=True, fields=options['fields']).data
+    return {
+        'totalCount': total,
+        'count': len(data),
+        'next': next_cursor,
+        'data': data
+    }
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from lib.benchmark import run_scenario, check_thresholds, load_thresholds, peak_rss_mb
+from comments.models import Comment, EventCommentCount
+from users.models import User
+from reliefweb.stub import ReliefWebStub, FakeDisasters
+from reliefweb.sync import sync_disasters
+
+BENCHMARKS = Path(settings.BASE_DIR) / 'benchmarks'
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark-password-1'
+EVENT = 1
+
+
+def scenarios(login_concurrency=4):
+    login = {
+        'method': 'POST',
+        'path': '/api/auth/login/',
+        'data': {'username': USERNAME, 'password': PASSWORD},
+        'route': '/api/auth/login/',
+    }
+    return {
+        'disasters': {'path': '/api/reliefweb/disasters/', 'route': '/api/reliefweb/disasters/'},
+        'disasters_filtered': {
+            'path': '/api/reliefweb/disasters/?status=alert&fields=id,name,date&limit=50',
+            'route': '/api/reliefweb/disasters/',
+        },
+        'stats': {'path': '/api/reliefweb/stats/', 'route': '/api/reliefweb/stats/'},
+        'stats_yearly': {'path': '/api/reliefweb/stats/?interval=year', 'route': '/api/reliefweb/stats/'},
+        'comments': {'path': f'/api/comments/?event={EVENT}', 'route': '/api/comments/'},
+        'login': login,
+        # Reads while logins keep the password hashing pool busy, which shouldn't slow them much
+        'comments_under_login': {
+            'path': f'/api/comments/?event={EVENT}',
+            'route': '/api/comments/',
+            'background': {**login, 'concurrency': login_concurrency},
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the API against a local ReliefWeb stub and a throwaway test database, '
+        'and checks the results against regression thresholds'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', help=f"Comma separated scenarios to run (default: all of {', '.join(scenarios())})")
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--login-requests', type=int, default=20, help='Requests for the login scenario, which hashes a password each time')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--login-concurrency', type=int, default=4, help='Clients logging in throughout the comments_under_login scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario')
+        parser.add_argument('--disasters', type=int, default=2000, help='Disasters served by the stub')
+        parser.add_argument('--description-size', type=int, default=500, help='Characters in each stub description')
+        parser.add_argument('--comments', type=int, default=200, help='Comments on the benchmarked event')
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stub waits before answering')
+        parser.add_argument('--output', default=str(BENCHMARKS / 'results.json'))
+        parser.add_argument('--thresholds', default=str(BENCHMARKS / 'thresholds.json'), help="Thresholds file, or 'none' to skip the check")
+
+    def handle(self, *args, **options):
+        selected = scenarios(options['login_concurrency'])
+        if options['scenarios']:
+            names = [name.strip() for name in options['scenarios'].split(',')]
+            unknown = [name for name in names if name not in selected]
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+            selected = {name: selected[name] for name in names}
+
+        # A file rather than an in-memory SQLite database, so every server thread gets its own connection
+        database = settings.DATABASES['default']
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            database.setdefault('TEST', {})['NAME'] = path
+
+        stub = ReliefWebStub(FakeDisasters(options['disasters'], options['description_size']), latency=options['latency'])
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            # Without the per-IP login limit, which every benchmark request would share
+            with stub, override_settings(RELIEFWEB_API_URL=stub.url, AUTH_THROTTLE_RATE=None):
+                self.seed(options)
+                results = self.run(selected, options)
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+
+        failures = []
+        if options['thresholds'] != 'none':
+            failures = check_thresholds(results, load_thresholds(options['thresholds']))
+        results['failures'] = failures
+
+        Path(options['output']).parent.mkdir(parents=True, exist_ok=True)
+        Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+        self.report(results)
+        if failures:
+            raise CommandError('Benchmark thresholds exceeded:\n' + '\n'.join(failures))
+
+    def seed(self, options):
+        sync_disasters(full=True)
+        user = User.objects.create_user(username=USERNAME, email='benchmark@example.com', password=PASSWORD)
+        Comment.objects.bulk_create([
+            Comment(content=f'Comment {number}', author=user, event=EVENT)
+            for number in range(options['comments'])
+        ])
+        EventCommentCount.rebuild()
+
+    def run(self, selected, options):
+        server = LiveServerThread('127.0.0.1', _StaticFilesHandler)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        if server.error:
+            raise server.error
+
+        try:
+            base_url = f'http://127.0.0.1:{server.port}'
+            measured = {}
+            for name, scenario in selected.items():
+                count = options['login_requests'] if name == 'login' else options['requests']
+                self.stdout.write(f'Running {name} ({count} requests)...')
+                measured[name] = run_scenario(base_url, scenario, count, options['concurrency'], options['warmup'])
+        finally:
+            server.terminate()
+
+        return {
+            'generated_at': timezone.now().isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'requests', 'login_requests', 'concurrency', 'login_concurrency', 'warmup',
+                    'disasters', 'description_size', 'comments', 'latency'
+                )
+            },
+            'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+            'scenarios': measured,
+        }
+
+    def report(self, results):
+        columns = ['rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries', 'errors']
+        self.stdout.write(f"{'scenario':<20}" + ''.join(f'{column:>10}' for column in columns))
+        for name, measured in results['scenarios'].items():
+            self.stdout.write(f'{name:<20}' + ''.join(f'{str(measured[column]):>10}' for column in columns))
+        self.stdout.write(f"peak RSS: {results['peak_rss_mb']} MB")
+        for failure in results['failures']:
+            self.stderr.write(failure)
@@ -0,0 +1,57 @@
+import json
+import timeit
+from pathlib import Path
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import JSONRenderer
+from lib.renderers import FastJSONRenderer, cached_body, dumps, orjson
+from reliefweb.stub import FakeDisasters
+
+TESTDATA = Path(__file__).resolve().parents[2] / 'testdata'
+
+
+def recorded_payloads(files):
+    payloads = {
+        # The default list: 100 disasters with long HTML descriptions
+        'disasters': FakeDisasters(100, description_size=4000)({'limit': 100}),
+        'stats': json.loads((TESTDATA / 'stats_facets.json').read_text()),
+    }
+    for file in files:
+        payloads[Path(file).stem] = json.loads(Path(file).read_text())
+    return payloads
+
+
+class Command(BaseCommand):
+    help = 'Compares the stock and fast JSON encoding paths on recorded payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Extra recorded JSON payloads to encode')
+        parser.add_argument('--number', type=int, default=200, help='Encodes per measurement')
+        parser.add_argument('--repeat', type=int, default=5, help='Measurements per path; the best one is reported')
+
+    def handle(self, *args, **options):
+        stock, fast = JSONRenderer(), FastJSONRenderer()
+        self.stdout.write(f"fast path: {'orjson' if orjson else 'stdlib fallback'}")
+        self.stdout.write(f"{'payload':<14}{'bytes':>10}{'JsonResponse':>14}{'DRF':>10}{'fast':>10}{'DRF fast':>10}{'reused':>10}  (µs per encode)")
+
+        for name, payload in recorded_payloads(options['files']).items():
+            key = f'benchmark_json:{name}'
+            cache.delete(key)
+            paths = {
+                'JsonResponse': lambda: json.dumps(payload, cls=DjangoJSONEncoder).encode(),
+                'DRF': lambda: stock.render(payload),
+                'fast': lambda: dumps(payload),
+                'DRF fast': lambda: fast.render(payload),
+                # An unchanged payload: one cache read, no encoding
+                'reused': lambda: cached_body(key, lambda: payload),
+            }
+            timings = {
+                path: min(timeit.repeat(run, number=options['number'], repeat=options['repeat'])) / options['number'] * 1e6
+                for path, run in paths.items()
+            }
+            cache.delete(key)
+            self.stdout.write(
+                f'{name:<14}{len(dumps(payload)):>10}'
+                + ''.join(f'{timings[path]:>{14 if path == "JsonResponse" else 10}.1f}' for path in paths)
+            )
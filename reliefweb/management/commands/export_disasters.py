@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from reliefweb.export import OUTPUTS, parse_export_params, export_disasters
+
+
+class Command(BaseCommand):
+    help = 'Writes the full disaster history from the local store as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=list(OUTPUTS), default='ndjson')
+        parser.add_argument('--file', help='Write to this file instead of stdout (appends when resuming)')
+        parser.add_argument('--after', help='Resume after the record with this cursor')
+
+    def handle(self, *args, **options):
+        try:
+            params = parse_export_params({'output': options['output'], 'after': options['after']})
+        except ValidationError as error:
+            raise CommandError(error.detail)
+
+        mode = 'ab' if options['after'] else 'wb'
+        target = open(options['file'], mode) if options['file'] else sys.stdout.buffer
+        try:
+            for chunk in export_disasters(params['output'], params['after']):
+                target.write(chunk)
+        finally:
+            if options['file']:
+                target.close()
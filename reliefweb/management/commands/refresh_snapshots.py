@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from reliefweb.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Syncs disasters from ReliefWeb and rebuilds the cached disasters and stats payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-sync', action='store_true', help='Rebuild the snapshots without syncing first')
+        parser.add_argument('--force', action='store_true', help='Refresh even if another worker holds the lease')
+
+    def handle(self, *args, **options):
+        if refresh_snapshots(sync=not options['no_sync'], force=options['force']):
+            self.stdout.write(self.style.SUCCESS('Snapshots refreshed'))
+        else:
+            self.stdout.write(self.style.WARNING('Another worker is refreshing the snapshots, use --force to refresh anyway'))
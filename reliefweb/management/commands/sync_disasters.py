@@ -0,0 +1,25 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from reliefweb.snapshots import save_snapshot
+from reliefweb.sync import sync_disasters, PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Pulls new and changed disasters from ReliefWeb into the local database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the high-water mark and refetch everything')
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            result = sync_disasters(full=options['full'], page_size=options['page_size'])
+        except requests.RequestException as error:
+            raise CommandError(f'ReliefWeb sync failed: {error}')
+
+        # Serve the new data straight away rather than at the next scheduled refresh
+        save_snapshot('disasters')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced disasters: {result['created']} created, {result['updated']} updated"
+        ))
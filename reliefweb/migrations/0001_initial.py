@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.IntegerField(help_text='ReliefWeb country ID', primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('shortname', models.CharField(blank=True, max_length=255)),
+                ('iso3', models.CharField(blank=True, db_index=True, max_length=3)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'countries',
+            },
+        ),
+        migrations.CreateModel(
+            name='DisasterType',
+            fields=[
+                ('id', models.IntegerField(help_text='ReliefWeb disaster type ID', primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('code', models.CharField(blank=True, max_length=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=50, unique=True)),
+                ('last_changed', models.DateTimeField(blank=True, null=True)),
+                ('last_synced', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Disaster',
+            fields=[
+                ('id', models.IntegerField(help_text='ReliefWeb disaster ID', primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('glide', models.CharField(blank=True, max_length=50)),
+                ('status', models.CharField(db_index=True, max_length=20)),
+                ('url', models.URLField(blank=True, max_length=500)),
+                ('description', models.TextField(blank=True)),
+                ('date_event', models.DateTimeField(blank=True, null=True)),
+                ('date_created', models.DateTimeField(blank=True, null=True)),
+                ('date_changed', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('countries', models.ManyToManyField(blank=True, related_name='disasters', to='reliefweb.country')),
+                ('primary_country', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='primary_disasters', to='reliefweb.country')),
+                ('primary_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='primary_disasters', to='reliefweb.disastertype')),
+                ('types', models.ManyToManyField(blank=True, related_name='disasters', to='reliefweb.disastertype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date_created', 'id'], name='disaster_created_id_idx')],
+            },
+        ),
+    ]
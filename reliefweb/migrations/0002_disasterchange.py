@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reliefweb', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisasterChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('closed', 'Closed')], max_length=10)),
+                ('date_changed', models.DateTimeField(blank=True, help_text='ReliefWeb date.changed after this change', null=True)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('disaster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='reliefweb.disaster')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:48
+
+from django.db import migrations, models
+from reliefweb.text import make_summary
+
+
+def fill_summaries(apps, schema_editor):
+    Disaster = apps.get_model('reliefweb', 'Disaster')
+    batch = []
+    for disaster in Disaster.objects.only('id', 'description').iterator(chunk_size=500):
+        disaster.summary = make_summary(disaster.description)
+        batch.append(disaster)
+        if len(batch) == 500:
+            Disaster.objects.bulk_update(batch, ['summary'])
+            batch = []
+    Disaster.objects.bulk_update(batch, ['summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reliefweb', '0002_disasterchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disaster',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Plain text excerpt of the description, refreshed by sync'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
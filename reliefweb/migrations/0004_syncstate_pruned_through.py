@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reliefweb', '0003_disaster_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='pruned_through',
+            field=models.BigIntegerField(default=0, help_text='Newest change log version pruned; feed tokens before it have expired'),
+        ),
+    ]
@@ -1,3 +1,91 @@
 from django.db import models
 
-# Create your models here.
+# Local copy of the ReliefWeb disasters feed, kept up to date by `manage.py sync_disasters`
+class Country(models.Model):
+    id = models.IntegerField(primary_key=True, help_text='ReliefWeb country ID')
+    name = models.CharField(max_length=255)
+    shortname = models.CharField(max_length=255, blank=True)
+    iso3 = models.CharField(max_length=3, blank=True, db_index=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'countries'
+
+    def __str__(self):
+        return f'{self.name} ({self.iso3})'
+
+
+class DisasterType(models.Model):
+    id = models.IntegerField(primary_key=True, help_text='ReliefWeb disaster type ID')
+    name = models.CharField(max_length=255)
+    code = models.CharField(max_length=10, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Disaster(models.Model):
+    id = models.IntegerField(primary_key=True, help_text='ReliefWeb disaster ID')
+    name = models.CharField(max_length=255)
+    glide = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, db_index=True)
+    url = models.URLField(max_length=500, blank=True)
+    description = models.TextField(blank=True)
+    summary = models.TextField(blank=True, help_text='Plain text excerpt of the description, refreshed by sync')
+    date_event = models.DateTimeField(null=True, blank=True)
+    date_created = models.DateTimeField(null=True, blank=True)
+    date_changed = models.DateTimeField(null=True, blank=True, db_index=True)
+    primary_country = models.ForeignKey(
+        to=Country,
+        related_name='primary_disasters',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    primary_type = models.ForeignKey(
+        to=DisasterType,
+        related_name='primary_disasters',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    countries = models.ManyToManyField(to=Country, related_name='disasters', blank=True)
+    types = models.ManyToManyField(to=DisasterType, related_name='disasters', blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='disaster_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'Disaster {self.id}: {self.name}'
+
+
+class DisasterChange(models.Model):
+    # Log of what each sync changed; the id is the version the changes feed hands out as a token
+    CREATED, UPDATED, CLOSED = 'created', 'updated', 'closed'
+    ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (CLOSED, 'Closed')]
+
+    disaster = models.ForeignKey(
+        to=Disaster,
+        related_name='changes',
+        on_delete=models.CASCADE
+    )
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    date_changed = models.DateTimeField(null=True, blank=True, help_text='ReliefWeb date.changed after this change')
+    recorded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'Disaster {self.disaster_id} {self.action} (version {self.id})'
+
+
+class SyncState(models.Model):
+    # High-water mark of ReliefWeb's `date.changed` for each synced resource
+    resource = models.CharField(max_length=50, unique=True)
+    last_changed = models.DateTimeField(null=True, blank=True)
+    last_synced = models.DateTimeField(null=True, blank=True)
+    pruned_through = models.BigIntegerField(default=0, help_text='Newest change log version pruned; feed tokens before it have expired')
+
+    def __str__(self):
+        return f'{self.resource} synced up to {self.last_changed}'
@@ -0,0 +1,135 @@
+import requests
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+from lib.renderers import ENCODED_TTL
+from .cache import DEFAULT_TTL
+from .client import get_reliefweb_stats
+from .listing import DEFAULT_FIELDS, split_param
+from .models import Disaster
+from .serializers.common import DisasterSerializer
+from .text import make_summary
+
+# IDs one lookup may ask for
+MAX_IDS = 100
+
+# Records from ReliefWeb rather than the local store aren't invalidated by
+# sync, so they are kept no longer than query responses are
+UPSTREAM_TTL = DEFAULT_TTL
+
+# Seconds an ID found nowhere is remembered, so repeated lookups don't go upstream
+MISSING_TTL = 60
+MISSING = 'missing'
+
+
+def record_key(disaster_id):
+    return f'reliefweb:disaster:{disaster_id}'
+
+
+def forget_disasters(disaster_ids):
+    """
+    Drops cached records, for sync to call once it has stored new versions.
+    """
+    cache.delete_many([record_key(disaster_id) for disaster_id in disaster_ids])
+
+
+def parse_ids_params(params):
+    """
+    Validates `ids` (comma separated disaster IDs) and the optional `fields`.
+    """
+    try:
+        ids = list(dict.fromkeys(int(value) for value in split_param(params, 'ids')))
+    except ValueError:
+        raise ValidationError({ 'ids': 'Must be comma separated numbers' })
+    if not 1 <= len(ids) <= MAX_IDS:
+        raise ValidationError({ 'ids': f'Must list between 1 and {MAX_IDS} IDs' })
+
+    fields = split_param(params, 'fields') or DEFAULT_FIELDS
+    unknown = [field for field in fields if field not in DEFAULT_FIELDS]
+    if unknown:
+        raise ValidationError({ 'fields': f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(DEFAULT_FIELDS)}" })
+    return {'ids': ids, 'fields': fields}
+
+
+def stored_records(disaster_ids):
+    disasters = Disaster.objects.filter(id__in=disaster_ids).select_related(
+        'primary_country', 'primary_type'
+    ).prefetch_related('countries', 'types').defer('description')
+    return {
+        disaster.id: DisasterSerializer(disaster, fields=DEFAULT_FIELDS).data
+        for disaster in disasters
+    }
+
+
+def upstream_records(disaster_ids):
+    """
+    Fetches disasters missing from the local store (e.g. before the first
+    sync has reached them) from ReliefWeb, all in one filtered query.
+    """
+    response = get_reliefweb_stats({
+        'filter': {'field': 'id', 'value': list(disaster_ids)},
+        'fields': {'include': [field for field in DEFAULT_FIELDS if field != 'summary'] + ['description']},
+        'limit': len(disaster_ids),
+    })
+    records = {}
+    for item in response.get('data', []):
+        fields = item['fields']
+        records[int(fields['id'])] = {'id': str(fields['id']), 'fields': {
+            **{field: fields.get(field) for field in DEFAULT_FIELDS if field != 'summary'},
+            'id': int(fields['id']),
+            'summary': make_summary(fields.get('description', '')),
+        }}
+    return records
+
+
+def get_disasters(disaster_ids):
+    """
+    Returns (records, error): a dict of disaster ID to record, in the default
+    list shape, for the IDs that exist, and the error if ReliefWeb had to be
+    asked and failed. Records come from the cache; misses are loaded from
+    the local store in one query, and the rest from ReliefWeb in one request.
+    """
+    keys = {disaster_id: record_key(disaster_id) for disaster_id in disaster_ids}
+    cached = cache.get_many(keys.values())
+    records = {disaster_id: cached[key] for disaster_id, key in keys.items() if key in cached}
+    error = None
+
+    misses = [disaster_id for disaster_id in disaster_ids if disaster_id not in records]
+    if misses:
+        stored = stored_records(misses)
+        cache.set_many({keys[disaster_id]: record for disaster_id, record in stored.items()}, ENCODED_TTL)
+        records.update(stored)
+        misses = [disaster_id for disaster_id in misses if disaster_id not in stored]
+
+    if misses:
+        try:
+            fetched = upstream_records(misses)
+        except requests.RequestException as exception:
+            fetched, error = {}, str(exception)
+        else:
+            cache.set_many({keys[disaster_id]: MISSING for disaster_id in misses if disaster_id not in fetched}, MISSING_TTL)
+        cache.set_many({keys[disaster_id]: record for disaster_id, record in fetched.items()}, UPSTREAM_TTL)
+        records.update(fetched)
+
+    return {disaster_id: record for disaster_id, record in records.items() if record != MISSING}, error
+
+
+def project(record, fields):
+    if set(fields) == set(DEFAULT_FIELDS):
+        return record
+    return {'id': record['id'], 'fields': {field: record['fields'][field] for field in fields}}
+
+
+def disaster_records(options):
+    """
+    Returns the requested disasters, in the order asked for, and the IDs
+    that weren't found, with the error in `errors` if ReliefWeb couldn't
+    be asked about them.
+    """
+    records, error = get_disasters(options['ids'])
+    data = [project(records[disaster_id], options['fields']) for disaster_id in options['ids'] if disaster_id in records]
+    return {
+        'count': len(data),
+        'missing': [disaster_id for disaster_id in options['ids'] if disaster_id not in records],
+        'data': data,
+        'errors': {'upstream': error} if error else {},
+    }
@@ -0,0 +1,53 @@
+from rest_framework import serializers
+from ..models import Country, DisasterType, Disaster
+
+class CountrySerializer(serializers.ModelSerializer):
+    location = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Country
+        fields = ['id', 'name', 'shortname', 'iso3', 'location']
+
+    def get_location(self, obj):
+        if obj.latitude is None or obj.longitude is None:
+            return None
+        return {'lat': obj.latitude, 'lon': obj.longitude}
+
+
+class DisasterTypeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DisasterType
+        fields = ['id', 'name', 'code']
+
+
+class DisasterSerializer(serializers.ModelSerializer):
+    primary_country = CountrySerializer(read_only=True)
+    country = CountrySerializer(source='countries', many=True, read_only=True)
+    primary_type = DisasterTypeSerializer(read_only=True)
+    type = DisasterTypeSerializer(source='types', many=True, read_only=True)
+    date = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Disaster
+        fields = [
+            'id', 'name', 'status', 'primary_country', 'country',
+            'primary_type', 'type', 'url', 'date', 'summary', 'description'
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Optional projection: keep only the requested fields
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_date(self, obj):
+        return {
+            'event': obj.date_event,
+            'created': obj.date_created,
+            'changed': obj.date_changed,
+        }
+
+    def to_representation(self, instance):
+        # Same shape as a ReliefWeb API item so the frontend reads `fields` as before
+        return {'id': str(instance.id), 'fields': super().to_representation(instance)}
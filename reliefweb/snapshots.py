@@ -0,0 +1,153 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from lib.http import make_etag
+from lib.renderers import dumps
+from .client import get_reliefweb_stats
+from .listing import parse_listing_params, disaster_listing
+from .stats import parse_stats_params, build_stats_query, build_stats_payload
+from .sync import data_version, sync_disasters
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY = 'reliefweb:snapshots:lease'
+
+
+def snapshot_key(name):
+    return f'reliefweb:snapshot:{name}'
+
+
+def build_disasters_payload():
+    return disaster_listing(parse_listing_params({}))
+
+
+def build_stats_snapshot_payload():
+    # Always goes upstream, so a refresh never re-serves what the query cache already holds
+    params = parse_stats_params({})
+    response = get_reliefweb_stats(build_stats_query(params))
+    return {**build_stats_payload(response, params), 'partial': False, 'stale': False, 'degraded': False, 'errors': {}}
+
+
+BUILDERS = {
+    'disasters': build_disasters_payload,
+    'stats': build_stats_snapshot_payload,
+}
+
+# Snapshots built from the local store, rebuilt on their next read once a sync
+# has changed it, even when that sync ran outside this process's scheduler
+STORE_SNAPSHOTS = {'disasters'}
+
+
+def save_snapshot(name):
+    """
+    Rebuilds one snapshot and stores it as encoded JSON bytes, ready to be sent as-is.
+    """
+    # Read before building, so a sync that lands meanwhile still triggers a rebuild
+    version = data_version()
+    return store_snapshot(name, BUILDERS[name](), version)
+
+
+def store_snapshot(name, payload, version=None):
+    body = dumps(payload)
+    etag = make_etag(body)
+    now = timezone.now()
+
+    # An unchanged rebuild keeps its Last-Modified, so conditional requests still match
+    previous = cache.get(snapshot_key(name))
+    modified_at = previous['modified_at'] if previous and previous['etag'] == etag else now
+
+    snapshot = {
+        'body': body,
+        'etag': etag,
+        'generated_at': now,
+        'modified_at': modified_at,
+        'version': version,
+    }
+    # No timeout: a snapshot stays until the next refresh replaces it
+    cache.set(snapshot_key(name), snapshot, timeout=None)
+    return snapshot
+
+
+def mark_snapshot_stale(name, error):
+    """
+    Flags the stored snapshot as stale and degraded after a failed rebuild,
+    so clients know the upstream data behind it is out of date.
+    """
+    snapshot = cache.get(snapshot_key(name))
+    if not snapshot:
+        return None
+    payload = json.loads(snapshot['body'])
+    if payload.get('degraded'):
+        return snapshot
+    return store_snapshot(name, {**payload, 'stale': True, 'degraded': True, 'errors': {name: str(error)}}, snapshot.get('version'))
+
+
+def get_snapshot(name):
+    """
+    Returns the stored snapshot, building it on the spot if none exists yet
+    or the local store has changed since it was built.
+    """
+    snapshot = cache.get(snapshot_key(name))
+    if snapshot is None or (name in STORE_SNAPSHOTS and snapshot.get('version') != data_version()):
+        return save_snapshot(name)
+    return snapshot
+
+
+def refresh_snapshots(sync=True, force=False):
+    """
+    Syncs the local store and rebuilds every snapshot. Only one worker
+    refreshes at a time: the others skip the round while the lease in the
+    shared cache is held. Returns False if the round was skipped.
+    """
+    owner = uuid.uuid4().hex
+    if not cache.add(LEASE_KEY, owner, timeout=settings.RELIEFWEB_SNAPSHOT_LEASE) and not force:
+        return False
+
+    try:
+        if sync:
+            try:
+                sync_disasters()
+            except requests.RequestException:
+                logger.exception('ReliefWeb sync failed, keeping the current local store')
+
+        for name in BUILDERS:
+            try:
+                save_snapshot(name)
+            except requests.RequestException as error:
+                logger.exception('Could not refresh the %s snapshot, keeping the previous one', name)
+                mark_snapshot_stale(name, error)
+    finally:
+        if cache.get(LEASE_KEY) == owner:
+            cache.delete(LEASE_KEY)
+    return True
+
+
+def run_scheduler():
+    interval = settings.RELIEFWEB_SNAPSHOT_INTERVAL
+    while True:
+        try:
+            refresh_snapshots()
+        except Exception:
+            logger.exception('Snapshot refresh failed')
+        finally:
+            close_old_connections()
+        # Jitter spreads the workers out so they don't all wake up together
+        time.sleep(interval * random.uniform(0.8, 1.2))
+
+
+def start_scheduler():
+    """
+    Starts the background refresh loop. The first round runs straight away,
+    which warms the snapshots as the process boots.
+    """
+    thread = threading.Thread(target=run_scheduler, name='reliefweb-snapshots', daemon=True)
+    thread.start()
+    return thread
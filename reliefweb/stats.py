@@ -0,0 +1,153 @@
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .models import Country
+
+INTERVALS = {
+    'year': '%Y',
+    'month': '%Y-%m',
+    'week': '%Y-%m-%d',
+    'day': '%Y-%m-%d',
+}
+
+DEFAULT_INTERVAL = 'month'
+
+# Without an explicit range the timeline covers this many days back from today
+DEFAULT_TIMELINE_DAYS = 365
+
+TOP_COUNTRIES = 10
+
+# Enough buckets for every type and status ReliefWeb uses
+TERM_FACET_LIMIT = 100
+
+
+def parse_stats_params(params):
+    """
+    Validates the optional `from`, `to` (ISO dates) and `interval` query parameters.
+    """
+    interval = params.get('interval', DEFAULT_INTERVAL)
+    if interval not in INTERVALS:
+        raise ValidationError({ 'interval': f"Must be one of: {', '.join(INTERVALS)}" })
+
+    dates = {}
+    for name in ('from', 'to'):
+        value = params.get(name)
+        if value:
+            parsed = parse_date(value)
+            if not parsed:
+                raise ValidationError({ name: 'Must be a date in YYYY-MM-DD format' })
+            dates[name] = parsed
+
+    if 'from' in dates and 'to' in dates and dates['from'] > dates['to']:
+        raise ValidationError({ 'from': 'Must not be after `to`' })
+
+    return {'interval': interval, 'from': dates.get('from'), 'to': dates.get('to')}
+
+
+def date_filter(date_from=None, date_to=None):
+    value = {}
+    if date_from:
+        value['from'] = f'{date_from.isoformat()}T00:00:00+00:00'
+    if date_to:
+        value['to'] = f'{date_to.isoformat()}T23:59:59+00:00'
+    return {'field': 'date.created', 'value': value}
+
+
+def build_stats_query(params):
+    """
+    Builds the single ReliefWeb query behind the stats endpoint. The most recent
+    disaster comes back as the one result, and every distribution comes back as
+    a facet computed by ReliefWeb over the whole (date filtered) dataset.
+    """
+    timeline_from = params['from']
+    if not timeline_from and not params['to']:
+        timeline_from = (timezone.now() - timedelta(days=DEFAULT_TIMELINE_DAYS)).date()
+
+    query = {
+        'limit': 1,
+        'sort': ['date:desc'],
+        'fields': {'include': ['name', 'status', 'date', 'primary_country', 'primary_type']},
+        'facets': [
+            {'field': 'primary_type', 'name': 'types', 'limit': TERM_FACET_LIMIT},
+            {'field': 'primary_country.iso3', 'name': 'countries', 'limit': TOP_COUNTRIES},
+            {'field': 'status', 'name': 'statuses', 'limit': TERM_FACET_LIMIT},
+            {
+                'field': 'date.created',
+                'name': 'timeline',
+                'interval': params['interval'],
+                'filter': date_filter(timeline_from, params['to'])
+            }
+        ]
+    }
+    if params['from'] or params['to']:
+        query['filter'] = date_filter(params['from'], params['to'])
+    return query
+
+
+def facet_counts(response, name):
+    facet = response.get('embedded', {}).get('facets', {}).get(name, {})
+    return [(bucket['value'], bucket['count']) for bucket in facet.get('data', [])]
+
+
+def build_stats_payload(response, params):
+    """
+    Turns the facet response into the payload the dashboard charts expect.
+    """
+    types = facet_counts(response, 'types')
+    statuses = dict(facet_counts(response, 'statuses'))
+    countries = facet_counts(response, 'countries')
+
+    recent_disaster = {}
+    if response.get('data'):
+        recent_disaster = response['data'][0].get('fields', {})
+
+    most_common_type, most_common_count = max(types, key=lambda bucket: bucket[1]) if types else ('N/A', 0)
+
+    # Facets only carry ISO3 codes, so names come from the synced country table
+    iso3_codes = [iso3.upper() for iso3, _ in countries]
+    names = dict(Country.objects.filter(iso3__in=iso3_codes).values_list('iso3', 'name'))
+    top_countries = [
+        {'iso3': iso3.upper(), 'name': names.get(iso3.upper(), iso3.upper()), 'disasters': count}
+        for iso3, count in countries
+    ]
+
+    label_format = INTERVALS[params['interval']]
+    disasters_overtime = []
+    for value, count in sorted(facet_counts(response, 'timeline')):
+        period = parse_datetime(value)
+        if period:
+            # Keyed `month` whatever the interval, which is what the dashboard chart reads
+            disasters_overtime.append({'month': period.strftime(label_format), 'count': count})
+
+    return {
+        'total': response.get('totalCount', 0),
+        'active_count': statuses.get('alert', 0),
+        'recent_disaster': recent_disaster,
+        'common_type': most_common_type,
+        'common_count': most_common_count,
+        'top_countries': top_countries,
+        'status_list': statuses,
+        'disasters_overtime': disasters_overtime,
+        'type_list': dict(types),
+        'interval': params['interval'],
+        'from': params['from'],
+        'to': params['to'],
+    }
+
+
+def empty_stats_payload(params):
+    return {
+        'total': None,
+        'active_count': None,
+        'recent_disaster': None,
+        'common_type': None,
+        'common_count': None,
+        'top_countries': None,
+        'status_list': None,
+        'disasters_overtime': None,
+        'type_list': None,
+        'interval': params['interval'],
+        'from': params['from'],
+        'to': params['to'],
+    }
@@ -0,0 +1,172 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length', 0))
+        query = json.loads(self.rfile.read(length) or b'{}')
+
+        with stub.lock:
+            stub.calls.append({'path': self.path, 'query': query})
+            status = stub.statuses.pop(0) if stub.statuses else 200
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if status != 200:
+            payload = {'error': {'status': status}}
+        elif callable(stub.payload):
+            payload = stub.payload(query)
+        else:
+            payload = stub.payload
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, as the latency tests intend
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReliefWebStub:
+    """
+    A fake ReliefWeb API on a local port, for tests and benchmarks. Point
+    RELIEFWEB_API_URL at `url`; every POST answers with `payload` (or what
+    `payload(query)` returns, if it is callable) after `latency` seconds,
+    except that the statuses queued in `statuses` are returned first, one
+    per call. Calls received are kept in `calls`.
+    """
+    def __init__(self, payload=None, latency=0):
+        self.payload = payload if payload is not None else {'totalCount': 0, 'count': 0, 'data': []}
+        self.latency = latency
+        self.statuses = []
+        self.calls = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}/v2'
+
+    def fail(self, *statuses):
+        with self.lock:
+            self.statuses.extend(statuses)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='reliefweb-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+COUNTRIES = [
+    {'id': 1, 'name': 'Kenya', 'shortname': 'Kenya', 'iso3': 'ken', 'location': {'lat': 0.5, 'lon': 37.9}},
+    {'id': 31, 'name': 'Bangladesh', 'shortname': 'Bangladesh', 'iso3': 'bgd', 'location': {'lat': 23.68, 'lon': 90.35}},
+    {'id': 119, 'name': 'India', 'shortname': 'India', 'iso3': 'ind', 'location': {'lat': 20.59, 'lon': 78.96}},
+    {'id': 188, 'name': 'Philippines', 'shortname': 'Philippines', 'iso3': 'phl', 'location': {'lat': 12.88, 'lon': 121.77}},
+    {'id': 97, 'name': 'Haiti', 'shortname': 'Haiti', 'iso3': 'hti', 'location': {'lat': 18.97, 'lon': -72.29}},
+]
+
+TYPES = [
+    {'id': 4611, 'name': 'Flood', 'code': 'FL'},
+    {'id': 4628, 'name': 'Earthquake', 'code': 'EQ'},
+    {'id': 4618, 'name': 'Tropical Cyclone', 'code': 'TC'},
+    {'id': 4642, 'name': 'Epidemic', 'code': 'EP'},
+]
+
+TIMELINE_FORMATS = {
+    'year': '%Y-01-01T00:00:00+00:00',
+    'month': '%Y-%m-01T00:00:00+00:00',
+    'day': '%Y-%m-%dT00:00:00+00:00',
+}
+
+
+class FakeDisasters:
+    """
+    A generated set of `count` disasters, answered in the shapes ReliefWeb
+    uses for the queries the app makes: paged field lists for the sync, and
+    facets for the stats. `description_size` sets the length of each
+    description, and so how big sync pages are. The same seed always
+    generates the same data.
+    """
+    def __init__(self, count, description_size=500, seed=1):
+        generator = random.Random(seed)
+        start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+        self.items = []
+        for id in range(1, count + 1):
+            country, disaster_type = generator.choice(COUNTRIES), generator.choice(TYPES)
+            created = start + timedelta(hours=id * 24 * 3650 // max(count, 1))
+            self.items.append({
+                'id': str(id),
+                'fields': {
+                    'id': id,
+                    'name': f"{country['name']}: {disaster_type['name']} - {created:%b %Y}",
+                    'status': generator.choice(['alert', 'current', 'past', 'past']),
+                    'url': f'https://reliefweb.int/node/{id}',
+                    'description': ('Lorem ipsum dolor sit amet. ' * (description_size // 28 + 1))[:description_size],
+                    'date': {
+                        'event': created.isoformat(),
+                        'created': created.isoformat(),
+                        'changed': created.isoformat(),
+                    },
+                    'primary_country': country,
+                    'country': [country],
+                    'primary_type': disaster_type,
+                    'type': [disaster_type],
+                }
+            })
+
+    def __call__(self, query):
+        if 'facets' in query:
+            return self.facets(query)
+        offset, limit = query.get('offset', 0), query.get('limit', 10)
+        page = self.items[offset:offset + limit]
+        return {'totalCount': len(self.items), 'count': len(page), 'data': page}
+
+    def facets(self, query):
+        facets = {}
+        for facet in query['facets']:
+            field, counts = facet['field'], Counter()
+            for item in self.items:
+                fields = item['fields']
+                if field == 'primary_type':
+                    counts[fields['primary_type']['name']] += 1
+                elif field == 'primary_country.iso3':
+                    counts[fields['primary_country']['iso3']] += 1
+                elif field == 'status':
+                    counts[fields['status']] += 1
+                elif field == 'date.created':
+                    created = datetime.fromisoformat(fields['date']['created'])
+                    counts[created.strftime(TIMELINE_FORMATS.get(facet.get('interval'), TIMELINE_FORMATS['month']))] += 1
+            buckets = counts.most_common(facet.get('limit'))
+            facets[facet['name']] = {'data': [{'value': value, 'count': count} for value, count in buckets]}
+
+        latest = max(self.items, key=lambda item: item['fields']['date']['created'], default=None)
+        return {
+            'totalCount': len(self.items),
+            'count': 1 if latest else 0,
+            'data': [latest] if latest else [],
+            'embedded': {'facets': facets},
+        }
@@ -0,0 +1,201 @@
+import uuid
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from search.index import index_disasters
+from .client import get_reliefweb_stats
+from .models import Country, DisasterType, Disaster, DisasterChange, SyncState
+from .records import forget_disasters
+from .text import make_summary
+
+SYNC_FIELDS = [
+    'id', 'name', 'status', 'primary_country', 'country',
+    'primary_type', 'type', 'url', 'date', 'description'
+]
+
+# ReliefWeb caps `limit` at 1000
+PAGE_SIZE = 500
+
+# Cache key of the local store's current version
+VERSION_KEY = 'reliefweb:data-version'
+
+# Days the change log is kept; changes feed tokens older than that have to reload the list
+RETENTION_DAYS = 30
+
+# Full pages with descriptions are large, so allow longer than a dashboard call
+SYNC_TIMEOUT = 30
+
+
+def parse_date(value):
+    return parse_datetime(value) if value else None
+
+
+def save_country(data, seen):
+    if data['id'] not in seen:
+        location = data.get('location') or {}
+        Country.objects.update_or_create(id=data['id'], defaults={
+            'name': data.get('name', ''),
+            'shortname': data.get('shortname', ''),
+            'iso3': data.get('iso3', '').upper(),
+            'latitude': location.get('lat'),
+            'longitude': location.get('lon'),
+        })
+        seen.add(data['id'])
+    return data['id']
+
+
+def save_type(data, seen):
+    if data['id'] not in seen:
+        DisasterType.objects.update_or_create(id=data['id'], defaults={
+            'name': data.get('name', ''),
+            'code': data.get('code', ''),
+        })
+        seen.add(data['id'])
+    return data['id']
+
+
+def save_disaster(fields, seen_countries, seen_types):
+    """
+    Upserts one ReliefWeb disaster record (the `fields` object) into the local store.
+    Returns (disaster, created).
+    """
+    dates = fields.get('date', {})
+    primary_country = fields.get('primary_country')
+    primary_type = fields.get('primary_type')
+
+    disaster, created = Disaster.objects.update_or_create(id=fields['id'], defaults={
+        'name': fields.get('name', ''),
+        'status': fields.get('status', ''),
+        'url': fields.get('url', ''),
+        'description': fields.get('description', ''),
+        'summary': make_summary(fields.get('description', '')),
+        'date_event': parse_date(dates.get('event')),
+        'date_created': parse_date(dates.get('created')),
+        'date_changed': parse_date(dates.get('changed')),
+        'primary_country_id': save_country(primary_country, seen_countries) if primary_country else None,
+        'primary_type_id': save_type(primary_type, seen_types) if primary_type else None,
+    })
+    disaster.countries.set([save_country(c, seen_countries) for c in fields.get('country', [])])
+    disaster.types.set([save_type(t, seen_types) for t in fields.get('type', [])])
+    return disaster, created
+
+
+def data_version():
+    """
+    Returns a token that changes whenever a sync changes the local store,
+    for keying anything derived from it.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def prune_changes(days=RETENTION_DAYS):
+    """
+    Deletes changes older than `days`, recording the newest deleted version
+    on the SyncState so feed tokens from before it expire, even once the log
+    is empty. Returns the number deleted.
+    """
+    through = DisasterChange.objects.filter(
+        recorded_at__lt=timezone.now() - timedelta(days=days)
+    ).aggregate(version=Max('id'))['version']
+    if through is None:
+        return 0
+    with transaction.atomic():
+        state, _ = SyncState.objects.select_for_update().get_or_create(resource='disasters')
+        state.pruned_through = max(state.pruned_through, through)
+        state.save(update_fields=['pruned_through'])
+        return DisasterChange.objects.filter(id__lte=through).delete()[0]
+
+
+def change_action(previous, disaster, created):
+    """
+    Returns the change log action for a saved record, or None when it was
+    refetched unchanged (the inclusive `from` filter and full syncs both do that).
+    """
+    if created:
+        return DisasterChange.CREATED
+    changed, status = previous
+    if changed == disaster.date_changed and status == disaster.status:
+        return None
+    if disaster.status == 'past' and status != 'past':
+        return DisasterChange.CLOSED
+    return DisasterChange.UPDATED
+
+
+def sync_disasters(full=False, page_size=PAGE_SIZE):
+    """
+    Pulls new and changed disasters from ReliefWeb into the local store.
+    Only records with `date.changed` at or after the stored high-water mark are
+    fetched, unless `full` is set. Every record that is new or has changed is
+    logged as a DisasterChange for the changes feed and reindexed for search. Returns a dict with
+    created/updated counts.
+    """
+    state, _ = SyncState.objects.get_or_create(resource='disasters')
+    since = None if full else state.last_changed
+    seen_countries, seen_types = set(), set()
+    created_count = updated_count = 0
+    store_changed = False
+    offset = 0
+
+    while True:
+        query = {
+            'fields': {'include': SYNC_FIELDS},
+            'limit': page_size,
+            'offset': offset,
+            'sort': ['date.changed:asc', 'id:asc']
+        }
+        if since:
+            # `from` is inclusive, so the last record of the previous run is refetched and upserted again
+            query['filter'] = {'field': 'date.changed', 'value': {'from': since.isoformat()}}
+
+        items = get_reliefweb_stats(query, timeout=SYNC_TIMEOUT).get('data', [])
+
+        # What the page's records looked like before, to tell real changes from refetches
+        previous = {
+            id: (changed, status) for id, changed, status in Disaster.objects.filter(
+                id__in=[item['fields']['id'] for item in items]
+            ).values_list('id', 'date_changed', 'status')
+        }
+        changes = []
+
+        # Commit page by page so an interrupted sync resumes from the last saved page
+        with transaction.atomic():
+            for item in items:
+                disaster, created = save_disaster(item['fields'], seen_countries, seen_types)
+                action = change_action(previous.get(disaster.id), disaster, created)
+                if action:
+                    changes.append(DisasterChange(disaster=disaster, action=action, date_changed=disaster.date_changed))
+                if created:
+                    created_count += 1
+                else:
+                    updated_count += 1
+                if disaster.date_changed and (not state.last_changed or disaster.date_changed > state.last_changed):
+                    state.last_changed = disaster.date_changed
+            DisasterChange.objects.bulk_create(changes)
+            store_changed = store_changed or bool(changes)
+            if changes:
+                index_disasters(Disaster.objects.filter(
+                    id__in=[change.disaster_id for change in changes]
+                ).prefetch_related('countries', 'types'))
+            state.last_synced = timezone.now()
+            state.save()
+        # Once committed, so a lookup in between can't cache the old version again
+        forget_disasters([change.disaster_id for change in changes])
+
+        if len(items) < page_size:
+            break
+        offset += page_size
+
+    if prune_changes() or store_changed:
+        bump_data_version()
+    return {'created': created_count, 'updated': updated_count}
@@ -1,3 +1,978 @@
-from django.test import TestCase
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import threading
+import time
+import warnings
+import requests
+from pathlib import Path
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from lib.http import choose_encoding
+from lib.pagination import encode_cursor
+from lib.benchmark import check_thresholds, percentile
+from lib.metrics import REQUEST_QUERIES
+from lib.renderers import FastJSONRenderer, dumps
+from comments.models import Comment, EventCommentCount
+from users.models import User
+from .models import Country, Disaster, DisasterChange, SyncState
+from .cache import cached_reliefweb_result, make_key, counters
+from . import client
+from .client import get_reliefweb_stats, ReliefWebUnavailable, CircuitBreaker, RetryBudget, TokenBucket
+from .export import export_disasters
+from .geo import build_tiles
+from .snapshots import LEASE_KEY, refresh_snapshots, save_snapshot
+from .stub import ReliefWebStub, FakeDisasters
+from .sync import prune_changes, sync_disasters
+from .text import make_summary
 
-# Create your tests here.
+TESTDATA = Path(__file__).resolve().parent / 'testdata'
+
+
+def load_testdata(name):
+    return json.loads((TESTDATA / name).read_text())
+
+
+COUNTRIES = {
+    'ken': {'id': 1, 'name': 'Kenya', 'shortname': 'Kenya', 'iso3': 'ken', 'location': {'lat': 0.5, 'lon': 37.9}},
+    'phl': {'id': 188, 'name': 'Philippines', 'shortname': 'Philippines', 'iso3': 'phl', 'location': {'lat': 12.88, 'lon': 121.77}},
+}
+
+TYPES = {
+    'FL': {'id': 4611, 'name': 'Flood', 'code': 'FL'},
+    'EQ': {'id': 4628, 'name': 'Earthquake', 'code': 'EQ'},
+}
+
+
+def make_item(id, changed, name='Flood', status='alert', iso3='ken', type_code='FL'):
+    return {
+        'id': str(id),
+        'fields': {
+            'id': id,
+            'name': f'{name} {id}',
+            'status': status,
+            'url': f'https://reliefweb.int/node/{id}',
+            'description': 'Heavy rain',
+            'date': {
+                'event': '2025-05-01T00:00:00+00:00',
+                'created': changed,
+                'changed': changed,
+            },
+            'primary_country': COUNTRIES[iso3],
+            'country': [COUNTRIES[iso3]],
+            'primary_type': TYPES[type_code],
+            'type': [TYPES[type_code]],
+        }
+    }
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+def scrape_metrics(client):
+    return client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+
+
+class SyncDisastersTests(TestCase):
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_sync_upserts_and_advances_high_water_mark(self, fetch):
+        fetch.return_value = {'data': [
+            make_item(1, '2025-05-01T00:00:00+00:00'),
+            make_item(2, '2025-05-03T00:00:00+00:00'),
+        ]}
+        result = sync_disasters()
+
+        self.assertEqual(result, {'created': 2, 'updated': 0})
+        self.assertNotIn('filter', fetch.call_args.args[0])
+        state = SyncState.objects.get(resource='disasters')
+        self.assertEqual(state.last_changed.isoformat(), '2025-05-03T00:00:00+00:00')
+        self.assertEqual(Disaster.objects.get(id=1).primary_country.iso3, 'KEN')
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_incremental_sync_filters_on_date_changed(self, fetch):
+        fetch.return_value = {'data': [make_item(1, '2025-05-01T00:00:00+00:00')]}
+        sync_disasters()
+
+        fetch.return_value = {'data': [make_item(1, '2025-05-04T00:00:00+00:00', status='past')]}
+        result = sync_disasters()
+
+        query = fetch.call_args.args[0]
+        self.assertEqual(query['filter'], {'field': 'date.changed', 'value': {'from': '2025-05-01T00:00:00+00:00'}})
+        self.assertEqual(result, {'created': 0, 'updated': 1})
+        self.assertEqual(Disaster.objects.get(id=1).status, 'past')
+
+
+class DisasterListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_list_is_served_from_local_store(self, fetch):
+        fetch.return_value = {'data': [
+            make_item(1, '2025-05-01T00:00:00+00:00'),
+            make_item(2, '2025-05-03T00:00:00+00:00'),
+        ]}
+        sync_disasters()
+
+        with patch('reliefweb.client.session.post') as post:
+            response = self.client.get('/api/reliefweb/disasters/')
+            post.assert_not_called()
+
+        body = response.json()
+        self.assertEqual(body['totalCount'], 2)
+        self.assertEqual([item['id'] for item in body['data']], ['2', '1'])
+        self.assertEqual(body['data'][0]['fields']['primary_type']['name'], 'Flood')
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class ChangesFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def poll(self, token, **params):
+        return self.client.get('/api/reliefweb/disasters/changes/', {'since': token, **params})
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_only_changes_since_the_token_are_returned(self, fetch):
+        token = self.client.get('/api/reliefweb/disasters/changes/').json()['token']
+
+        fetch.return_value = {'data': [
+            make_item(1, '2025-05-01T00:00:00+00:00'),
+            make_item(2, '2025-05-02T00:00:00+00:00'),
+        ]}
+        sync_disasters()
+        body = self.poll(token).json()
+        self.assertEqual([(item['id'], item['change']) for item in body['data']], [('1', 'created'), ('2', 'created')])
+
+        # Refetching unchanged records logs nothing
+        token = body['token']
+        sync_disasters(full=True)
+        self.assertEqual(self.poll(token).json()['data'], [])
+
+        fetch.return_value = {'data': [
+            make_item(1, '2025-05-05T00:00:00+00:00', status='past'),
+            make_item(2, '2025-05-06T00:00:00+00:00', name='Flash flood'),
+        ]}
+        sync_disasters()
+        body = self.poll(token).json()
+        self.assertEqual([(item['id'], item['change']) for item in body['data']], [('1', 'closed'), ('2', 'updated')])
+        self.assertEqual(body['data'][0]['fields']['status'], 'past')
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_changes_are_paged(self, fetch):
+        fetch.return_value = {'data': [make_item(id, f'2025-05-0{id}T00:00:00+00:00') for id in range(1, 4)]}
+        sync_disasters()
+
+        first = self.poll(encode_cursor([0]), limit=2).json()
+        self.assertTrue(first['more'])
+        second = self.poll(first['token'], limit=2).json()
+        self.assertFalse(second['more'])
+        self.assertEqual([item['id'] for item in first['data'] + second['data']], ['1', '2', '3'])
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_bad_and_expired_tokens(self, fetch):
+        fetch.return_value = {'data': [make_item(id, f'2025-05-0{id}T00:00:00+00:00') for id in range(1, 4)]}
+        sync_disasters()
+        oldest = DisasterChange.objects.order_by('id').first()
+        DisasterChange.objects.filter(id__lte=oldest.id + 1).delete()
+
+        self.assertEqual(self.poll('not-a-token').status_code, 400)
+        self.assertEqual(self.poll(encode_cursor([oldest.id - 1])).status_code, 410)
+        self.assertEqual(self.poll(encode_cursor([oldest.id + 1])).json()['count'], 1)
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_tokens_expire_when_the_whole_log_is_pruned(self, fetch):
+        fetch.return_value = {'data': [make_item(id, f'2025-05-0{id}T00:00:00+00:00') for id in range(1, 4)]}
+        sync_disasters()
+        old_token = self.poll(encode_cursor([0]), limit=1).json()['token']
+
+        self.assertEqual(prune_changes(days=-1), 3)
+        self.assertFalse(DisasterChange.objects.exists())
+        self.assertEqual(self.poll(old_token).status_code, 410)
+
+        # A fresh token starts from the pruning mark and sees what comes next
+        token = self.client.get('/api/reliefweb/disasters/changes/').json()['token']
+        self.assertEqual(self.poll(token).json()['count'], 0)
+        fetch.return_value = {'data': [make_item(4, '2025-05-04T00:00:00+00:00')]}
+        sync_disasters()
+        self.assertEqual([item['id'] for item in self.poll(token).json()['data']], ['4'])
+
+
+class ReliefWebCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_key_ignores_dict_order(self):
+        self.assertEqual(
+            make_key({'limit': 1, 'sort': ['date:desc']}),
+            make_key({'sort': ['date:desc'], 'limit': 1})
+        )
+
+    def test_fresh_entry_is_served_from_cache(self):
+        with patch('reliefweb.cache.get_reliefweb_stats', return_value={'totalCount': 3}) as fetch:
+            hits = counters['hits']
+            cached_reliefweb_result({'limit': 1})
+            self.assertEqual(cached_reliefweb_result({'limit': 1})[0], {'totalCount': 3})
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(counters['hits'], hits + 1)
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        refreshed = threading.Event()
+
+        def fetch(query, timeout):
+            refreshed.set()
+            return {'totalCount': 2}
+
+        with patch('reliefweb.cache.get_reliefweb_stats', return_value={'totalCount': 1}):
+            cached_reliefweb_result({'limit': 1}, ttl=0)
+
+        with patch('reliefweb.cache.get_reliefweb_stats', side_effect=fetch):
+            self.assertEqual(cached_reliefweb_result({'limit': 1}), ({'totalCount': 1}, True))
+            self.assertTrue(refreshed.wait(2))
+            time.sleep(0.05)
+
+        self.assertEqual(cached_reliefweb_result({'limit': 1})[0], {'totalCount': 2})
+
+    def test_concurrent_misses_are_coalesced(self):
+        def slow_fetch(query, timeout):
+            time.sleep(0.2)
+            return {'totalCount': 5}
+
+        with patch('reliefweb.cache.get_reliefweb_stats', side_effect=slow_fetch) as fetch:
+            threads = [threading.Thread(target=cached_reliefweb_result, args=({'limit': 1},)) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(fetch.call_count, 1)
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Country.objects.create(id=31, name='Bangladesh', iso3='BGD')
+        Country.objects.create(id=188, name='Philippines', iso3='PHL')
+
+    def test_stats_are_built_from_one_facet_query(self):
+        with patch('reliefweb.cache.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')) as fetch:
+            body = self.client.get('/api/reliefweb/stats/?interval=month').json()
+
+        self.assertEqual(fetch.call_count, 1)
+        facets = {facet['name']: facet for facet in fetch.call_args.args[0]['facets']}
+        self.assertEqual(facets['timeline']['interval'], 'month')
+
+        self.assertEqual(body['total'], 3871)
+        self.assertEqual(body['active_count'], 30)
+        self.assertEqual(body['common_type'], 'Flood')
+        self.assertEqual(body['common_count'], 1342)
+        self.assertEqual(body['top_countries'][0], {'iso3': 'PHL', 'name': 'Philippines', 'disasters': 201})
+        self.assertEqual(body['top_countries'][1], {'iso3': 'IND', 'name': 'IND', 'disasters': 143})
+        self.assertEqual(body['status_list'], {'past': 3702, 'current': 139, 'alert': 30})
+        self.assertEqual([point['month'] for point in body['disasters_overtime']], ['2025-04', '2025-05', '2025-06'])
+        self.assertEqual(body['recent_disaster']['name'], 'Bangladesh: Floods and Landslides - Jun 2025')
+        self.assertFalse(body['partial'])
+
+    def test_date_range_and_interval_are_pushed_upstream(self):
+        with patch('reliefweb.cache.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')) as fetch:
+            body = self.client.get('/api/reliefweb/stats/?from=2025-01-01&to=2025-06-30&interval=year').json()
+
+        query = fetch.call_args.args[0]
+        self.assertEqual(query['filter'], {
+            'field': 'date.created',
+            'value': {'from': '2025-01-01T00:00:00+00:00', 'to': '2025-06-30T23:59:59+00:00'}
+        })
+        self.assertEqual(query['facets'][3]['interval'], 'year')
+        self.assertEqual(body['disasters_overtime'][0], {'month': '2025', 'count': 11})
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.client.get('/api/reliefweb/stats/?interval=hour').status_code, 400)
+        self.assertEqual(self.client.get('/api/reliefweb/stats/?from=yesterday').status_code, 400)
+
+    def test_upstream_failure_is_reported_not_zeroed(self):
+        with patch('reliefweb.cache.get_reliefweb_stats', side_effect=requests.ConnectionError('upstream down')):
+            body = self.client.get('/api/reliefweb/stats/?interval=month').json()
+
+        self.assertIsNone(body['total'])
+        self.assertTrue(body['partial'])
+        self.assertIn('stats', body['errors'])
+
+
+class ResilientClientTests(TestCase):
+    """
+    Runs the client against a local fake ReliefWeb that injects latency and errors.
+    """
+    def setUp(self):
+        cache.clear()
+        self.stub = ReliefWebStub(payload=load_testdata('stats_facets.json')).start()
+        self.addCleanup(self.stub.stop)
+        settings = override_settings(RELIEFWEB_API_URL=self.stub.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.use(breaker=CircuitBreaker(3, 30), retry_budget=RetryBudget(0.2), rate_limiter=TokenBucket(10, 10))
+        patcher = patch('reliefweb.client.backoff', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use(self, **objects):
+        for name, value in objects.items():
+            patcher = patch.object(client, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_transient_errors_are_retried(self):
+        self.stub.fail(503, 429)
+        self.assertEqual(get_reliefweb_stats({'limit': 1})['totalCount'], 3871)
+        self.assertEqual(len(self.stub.calls), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.stub.fail(400)
+        with self.assertRaises(requests.HTTPError):
+            get_reliefweb_stats({'limit': 1})
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertFalse(client.breaker.is_failing)
+
+    def test_slow_upstream_times_out(self):
+        self.stub.latency = 0.5
+        self.use(retry_budget=RetryBudget(0, minimum=0))
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            get_reliefweb_stats({'limit': 1}, timeout=(1, 0.1))
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_retries_stop_when_the_budget_is_spent(self):
+        self.use(retry_budget=RetryBudget(0, minimum=1))
+        self.stub.fail(503, 503, 503, 503)
+        with self.assertRaises(requests.HTTPError):
+            get_reliefweb_stats({'limit': 1})
+        with self.assertRaises(requests.HTTPError):
+            get_reliefweb_stats({'limit': 1})
+        self.assertEqual(len(self.stub.calls), 3)
+
+    def test_open_circuit_fails_fast_then_lets_a_trial_through(self):
+        self.use(breaker=CircuitBreaker(2, 0.2), retry_budget=RetryBudget(0, minimum=0))
+        self.stub.fail(503, 503)
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                get_reliefweb_stats({'limit': 1})
+
+        with self.assertRaises(ReliefWebUnavailable):
+            get_reliefweb_stats({'limit': 1})
+        self.assertEqual(len(self.stub.calls), 2)
+
+        time.sleep(0.25)
+        self.assertEqual(get_reliefweb_stats({'limit': 1})['totalCount'], 3871)
+        self.assertFalse(client.breaker.is_failing)
+
+    def test_rate_limit_is_enforced(self):
+        self.use(rate_limiter=TokenBucket(0.001, 2))
+        get_reliefweb_stats({'limit': 1})
+        get_reliefweb_stats({'limit': 1})
+        with self.assertRaises(ReliefWebUnavailable):
+            get_reliefweb_stats({'limit': 1})
+        self.assertEqual(len(self.stub.calls), 2)
+
+    def test_upstream_calls_are_measured(self):
+        def count(status):
+            series = client.UPSTREAM_DURATION.series.get((status,))
+            return sum(series[:-1]) if series else 0
+
+        ok, unavailable = count(200), count(503)
+        self.stub.fail(503)
+        get_reliefweb_stats({'limit': 1})
+
+        self.assertEqual(count(200), ok + 1)
+        self.assertEqual(count(503), unavailable + 1)
+        body = scrape_metrics(self.client)
+        self.assertIn('crisismap_reliefweb_request_duration_seconds_bucket{status="503",le="0.005"}', body)
+
+    def test_stats_fall_back_to_the_last_good_response(self):
+        self.assertFalse(self.client.get('/api/reliefweb/stats/?interval=year').json()['stale'])
+
+        # The fresh and stale windows are over, and ReliefWeb is down
+        cache.delete(make_key(self.stub.calls[0]['query']))
+        self.stub.fail(*[503] * 3)
+        body = self.client.get('/api/reliefweb/stats/?interval=year').json()
+
+        self.assertEqual(body['total'], 3871)
+        self.assertTrue(body['stale'])
+        self.assertTrue(body['degraded'])
+        self.assertFalse(body['partial'])
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_disasters_snapshot_is_served_without_queries(self, fetch):
+        fetch.return_value = {'data': [make_item(1, '2025-05-01T00:00:00+00:00')]}
+        sync_disasters()
+        save_snapshot('disasters')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/reliefweb/disasters/')
+        self.assertEqual(response.json()['data'][0]['id'], '1')
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_disasters_snapshot_follows_syncs_made_elsewhere(self, fetch):
+        fetch.return_value = {'data': [make_item(1, '2025-05-01T00:00:00+00:00')]}
+        sync_disasters()
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/').json()['totalCount'], 1)
+
+        # e.g. `manage.py sync_disasters` run by hand, with no snapshot refresh after it
+        fetch.return_value = {'data': [make_item(2, '2025-05-02T00:00:00+00:00')]}
+        sync_disasters()
+        body = self.client.get('/api/reliefweb/disasters/').json()
+        self.assertEqual(body['totalCount'], 2)
+        self.assertEqual(body['data'][0]['id'], '2')
+
+    def test_default_stats_are_built_once(self):
+        with patch('reliefweb.snapshots.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')) as fetch:
+            self.client.get('/api/reliefweb/stats/')
+            body = self.client.get('/api/reliefweb/stats/').json()
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(body['total'], 3871)
+
+    def test_cold_stats_snapshot_failure_is_reported(self):
+        with patch('reliefweb.snapshots.get_reliefweb_stats', side_effect=requests.ConnectionError('upstream down')):
+            body = self.client.get('/api/reliefweb/stats/').json()
+
+        self.assertTrue(body['partial'])
+        self.assertIsNone(body['total'])
+
+    @patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': []})
+    def test_lease_allows_one_refresh_at_a_time(self, fetch):
+        cache.add(LEASE_KEY, 'another-worker')
+
+        with patch('reliefweb.snapshots.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')):
+            self.assertFalse(refresh_snapshots())
+            self.assertTrue(refresh_snapshots(force=True))
+
+        self.assertEqual(fetch.call_count, 1)
+
+    @patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': []})
+    def test_failed_refresh_keeps_previous_snapshot(self, fetch):
+        with patch('reliefweb.snapshots.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')):
+            refresh_snapshots()
+        with patch('reliefweb.snapshots.get_reliefweb_stats', side_effect=requests.ConnectionError('upstream down')):
+            with self.assertLogs('reliefweb.snapshots', level='ERROR'):
+                refresh_snapshots()
+
+        body = self.client.get('/api/reliefweb/stats/').json()
+        self.assertEqual(body['total'], 3871)
+        self.assertTrue(body['stale'])
+        self.assertTrue(body['degraded'])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_requests_are_recorded_by_route(self):
+        Disaster.objects.create(id=1, name='Flood', date_created='2025-05-01T00:00:00Z')
+        route = '/api/reliefweb/disasters/'
+        before = sum(REQUEST_QUERIES.series.get((route,), [0])[:-1])
+
+        self.client.get('/api/reliefweb/disasters/?limit=1')
+        self.client.get('/api/reliefweb/disasters/?limit=2')
+
+        self.assertEqual(sum(REQUEST_QUERIES.series[(route,)][:-1]), before + 2)
+        body = scrape_metrics(self.client)
+        self.assertIn('# TYPE crisismap_http_request_duration_seconds histogram', body)
+        self.assertIn(f'crisismap_http_request_duration_seconds_count{{route="{route}",method="GET",status="200"}}', body)
+        self.assertIn(f'crisismap_http_request_db_seconds_total{{route="{route}"}}', body)
+        self.assertIn('crisismap_reliefweb_cache_hit_ratio', body)
+
+    async def test_queries_are_recorded_under_asgi(self):
+        # The view's queries run in a sync_to_async thread rather than the middleware's
+        await Disaster.objects.acreate(id=1, name='Flood', date_created='2025-05-01T00:00:00Z')
+        route = '/api/reliefweb/disasters/'
+        before = sum(REQUEST_QUERIES.series.get((route,), [0])[:-1])
+        response = await self.async_client.get('/api/reliefweb/disasters/?limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(REQUEST_QUERIES.series[(route,)][:-1]), before + 1)
+
+    def test_ids_in_paths_do_not_add_series(self):
+        self.client.get('/api/comments/123/')
+        self.client.get('/api/comments/456/')
+        body = scrape_metrics(self.client)
+        self.assertIn('route="/api/comments/<int:pk>/"', body)
+        self.assertNotIn('/api/comments/456/', body)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_closed_without_a_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fake_disasters_answer_sync_and_stats_queries(self):
+        fake = FakeDisasters(30)
+        fetch = lambda query, timeout: fake(query)
+        with patch('reliefweb.sync.get_reliefweb_stats', side_effect=fetch):
+            self.assertEqual(sync_disasters(full=True, page_size=10), {'created': 30, 'updated': 0})
+        with patch('reliefweb.cache.get_reliefweb_stats', side_effect=fetch):
+            body = self.client.get('/api/reliefweb/stats/?interval=year').json()
+
+        self.assertEqual(body['total'], 30)
+        self.assertEqual(sum(body['type_list'].values()), 30)
+        self.assertEqual(sum(period['count'] for period in body['disasters_overtime']), 30)
+
+    def test_thresholds(self):
+        self.assertEqual(percentile([10, 20, 30, 40], 0.5), 20)
+        self.assertEqual(percentile([10, 20, 30, 40], 0.99), 40)
+
+        results = {'peak_rss_mb': 120, 'scenarios': {'stats': {'p95_ms': 80, 'rps': 40, 'queries': 0}}}
+        thresholds = {'peak_rss_mb': 100, 'scenarios': {'stats': {'p95_ms': 100, 'rps': 50, 'queries': 0}, 'login': {'p95_ms': 1}}}
+        self.assertEqual(check_thresholds(results, thresholds), [
+            'peak_rss_mb is 120, above the threshold of 100',
+            'stats.rps is 40, below the threshold of 50',
+        ])
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_sections_are_assembled_in_one_response(self, fetch):
+        fetch.return_value = {'data': [make_item(1, '2025-05-01T00:00:00+00:00'), make_item(2, '2025-05-02T00:00:00+00:00')]}
+        sync_disasters()
+        save_snapshot('disasters')
+        with patch('reliefweb.snapshots.get_reliefweb_stats', return_value=load_testdata('stats_facets.json')):
+            save_snapshot('stats')
+        user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        Comment.objects.create(content='Roads closed', author=user, event=1)
+        EventCommentCount.adjust(1, 1)
+
+        # Snapshots come from the cache; then disaster ids, their counts and the comments page
+        with self.assertNumQueries(3):
+            body = self.client.get('/api/reliefweb/dashboard/?event=1').json()
+
+        self.assertEqual(list(body), ['disasters', 'stats', 'counts', 'comments', 'errors'])
+        self.assertEqual([item['id'] for item in body['disasters']['data']], ['2', '1'])
+        self.assertEqual(body['stats']['total'], 3871)
+        self.assertEqual(body['counts'], {'2': 0, '1': 1})
+        self.assertEqual(body['comments']['results'][0]['content'], 'Roads closed')
+        self.assertEqual(body['errors'], {})
+
+    def test_sections_can_be_chosen(self):
+        body = self.client.get('/api/reliefweb/dashboard/?sections=counts').json()
+        self.assertEqual(body, {'counts': {}, 'errors': {}})
+
+    def test_failed_section_is_null(self):
+        with patch('reliefweb.snapshots.get_reliefweb_stats', side_effect=requests.ConnectionError('upstream down')):
+            body = self.client.get('/api/reliefweb/dashboard/?sections=stats,counts').json()
+
+        self.assertIsNone(body['stats'])
+        self.assertEqual(body['errors'], {'stats': 'upstream down'})
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.client.get('/api/reliefweb/dashboard/?sections=weather').status_code, 400)
+        self.assertEqual(self.client.get('/api/reliefweb/dashboard/?sections=comments').status_code, 400)
+        self.assertEqual(self.client.get('/api/reliefweb/dashboard/?event=flood').status_code, 400)
+
+
+class FastRenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_dumps_matches_the_stdlib_encoding(self):
+        value = {
+            'when': datetime.datetime(2025, 5, 1, 12, 30, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2025, 5, 1),
+            'amount': decimal.Decimal('1.50'),
+            1: 'int key',
+            'name': 'Côte d’Ivoire',
+        }
+        self.assertEqual(json.loads(dumps(value)), {
+            'when': '2025-05-01T12:30:00Z', 'day': '2025-05-01', 'amount': '1.50', '1': 'int key', 'name': 'Côte d’Ivoire'
+        })
+
+    def test_renderer(self):
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render({'text': 'a\u2028b'}), b'{"text":"a\\u2028b"}')
+        self.assertEqual(renderer.render(b'{"ready":true}'), b'{"ready":true}')
+        self.assertEqual(renderer.render(None), b'')
+
+    @patch('reliefweb.sync.get_reliefweb_stats')
+    def test_unchanged_listing_is_not_rebuilt(self, fetch):
+        fetch.return_value = {'data': [make_item(1, '2025-05-01T00:00:00+00:00')]}
+        sync_disasters()
+        first = self.client.get('/api/reliefweb/disasters/?limit=5')
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/reliefweb/disasters/?limit=5')
+        self.assertEqual(first.content, second.content)
+
+        # A sync that changes the store gets a fresh listing
+        fetch.return_value = {'data': [make_item(2, '2025-05-02T00:00:00+00:00')]}
+        sync_disasters()
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/?limit=5').json()['totalCount'], 2)
+
+
+class MapLayerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with patch('reliefweb.sync.get_reliefweb_stats') as fetch:
+            fetch.return_value = {'data': [
+                make_item(1, '2025-05-01T00:00:00+00:00'),
+                make_item(2, '2025-05-02T00:00:00+00:00'),
+                make_item(3, '2025-05-03T00:00:00+00:00', status='past', type_code='EQ'),
+                make_item(4, '2025-05-04T00:00:00+00:00', iso3='phl', type_code='EQ'),
+            ]}
+            sync_disasters()
+        # Close enough to Kenya to share a cell when zoomed out
+        ethiopia = Country.objects.create(id=87, name='Ethiopia', iso3='ETH', latitude=9.1, longitude=40.5)
+        Disaster.objects.create(id=5, name='Drought', status='current', date_created='2025-05-05T00:00:00Z', primary_country=ethiopia)
+        # Without a centroid it can't be placed
+        Disaster.objects.create(id=6, name='Epidemic', status='alert', date_created='2025-05-06T00:00:00Z')
+
+    def features(self, **params):
+        response = self.client.get('/api/reliefweb/map/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_country_aggregates(self):
+        layer = self.features()
+        self.assertEqual(layer['type'], 'FeatureCollection')
+        self.assertEqual((layer['total'], layer['unlocated']), (5, 1))
+
+        kenya = next(feature for feature in layer['features'] if feature['id'] == 'KEN')
+        self.assertEqual(kenya['geometry'], {'type': 'Point', 'coordinates': [37.9, 0.5]})
+        self.assertEqual(kenya['properties']['count'], 3)
+        self.assertEqual(kenya['properties']['types'], {'Flood': 2, 'Earthquake': 1})
+        self.assertEqual(kenya['properties']['statuses'], {'alert': 2, 'past': 1})
+
+        with self.assertNumQueries(0):
+            self.features()
+
+    def test_filters_and_bbox(self):
+        self.assertEqual([feature['id'] for feature in self.features(status='alert')['features']], ['KEN', 'PHL'])
+        self.assertEqual([feature['id'] for feature in self.features(bbox='100,0,130,20')['features']], ['PHL'])
+
+    def test_clusters_merge_nearby_countries_when_zoomed_out(self):
+        layer = self.features(layer='clusters', zoom=0)
+        clusters = {tuple(feature['properties']['countries']): feature for feature in layer['features']}
+        self.assertEqual(set(clusters), {('ETH', 'KEN'), ('PHL',)})
+        self.assertEqual(clusters[('ETH', 'KEN')]['properties']['count'], 4)
+        self.assertEqual(clusters[('ETH', 'KEN')]['properties']['statuses'], {'alert': 2, 'past': 1, 'current': 1})
+        # Weighted towards Kenya, which has three of the four
+        lon, lat = clusters[('ETH', 'KEN')]['geometry']['coordinates']
+        self.assertAlmostEqual(lon, (37.9 * 3 + 40.5) / 4)
+        self.assertAlmostEqual(lat, (0.5 * 3 + 9.1) / 4)
+
+        self.assertEqual(len(self.features(layer='clusters', zoom=5, bbox='30,-10,130,20')['features']), 3)
+
+    def test_panning_reuses_cached_tiles(self):
+        with patch('reliefweb.geo.build_tiles', wraps=build_tiles) as build:
+            self.features(layer='clusters', zoom=3, bbox='30,-10,40,5')
+            first = build.call_args[0][2]
+            with self.assertNumQueries(0):
+                layer = self.features(layer='clusters', zoom=3, bbox='30,-10,130,20')
+            second = build.call_args[0][2]
+        self.assertTrue(first)
+        self.assertFalse(first & second)
+        self.assertEqual(layer['total'], 5)
+
+    def test_invalid_params_are_rejected(self):
+        for params in ['layer=heatmap', 'zoom=11', 'zoom=a', 'bbox=1,2,3', 'bbox=10,0,-10,5', 'bbox=0,0,200,5', 'layer=clusters&zoom=10']:
+            self.assertEqual(self.client.get(f'/api/reliefweb/map/?{params}').status_code, 400, params)
+
+
+class SummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.description = '## Situation\n\nHeavy **rains** &amp; [flooding](https://example.org) in *Nairobi*.\n\n' + '- More rain is forecast. ' * 200
+        item = make_item(1, '2025-05-01T00:00:00+00:00')
+        item['fields']['description'] = self.description
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [item]}):
+            sync_disasters()
+
+    def test_summary_is_stored_at_sync(self):
+        summary = Disaster.objects.get(id=1).summary
+        self.assertTrue(summary.startswith('Situation Heavy rains & flooding in Nairobi. More rain is forecast.'))
+        self.assertLessEqual(len(summary), 281)
+        self.assertTrue(summary.endswith('…'))
+        self.assertEqual(make_summary('Short <b>and</b> plain'), 'Short and plain')
+
+    def test_list_carries_the_summary_instead_of_the_description(self):
+        fields = self.client.get('/api/reliefweb/disasters/?limit=10').json()['data'][0]['fields']
+        self.assertNotIn('description', fields)
+        self.assertEqual(fields['summary'], Disaster.objects.get(id=1).summary)
+
+        full = self.client.get('/api/reliefweb/disasters/?limit=10&fields=id,name,description').json()['data'][0]['fields']
+        self.assertEqual(full['description'], self.description)
+
+        summary_size = len(self.client.get('/api/reliefweb/disasters/?limit=10').content)
+        description_size = len(self.client.get('/api/reliefweb/disasters/?limit=10&fields=id,name,status,primary_country,country,primary_type,type,url,date,description').content)
+        self.assertLess(summary_size, description_size / 3)
+
+    def test_description_endpoint(self):
+        response = self.client.get('/api/reliefweb/disasters/1/description/')
+        self.assertEqual(response.json(), {'id': '1', 'description': self.description})
+
+        again = self.client.get('/api/reliefweb/disasters/1/description/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/2/description/').status_code, 404)
+
+
+class DisasterRecordTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with patch('reliefweb.sync.get_reliefweb_stats') as fetch:
+            fetch.return_value = {'data': [
+                make_item(1, '2025-05-01T00:00:00+00:00'),
+                make_item(2, '2025-05-02T00:00:00+00:00', iso3='phl', type_code='EQ'),
+            ]}
+            sync_disasters()
+
+    def test_detail_is_cached_per_record(self):
+        record = self.client.get('/api/reliefweb/disasters/1/').json()
+        self.assertEqual(record['id'], '1')
+        self.assertEqual(record['fields']['name'], 'Flood 1')
+        self.assertEqual(record['fields']['summary'], 'Heavy rain')
+        self.assertNotIn('description', record['fields'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/reliefweb/disasters/1/').json(), record)
+
+        # A sync that changes it drops the cached record
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [make_item(1, '2025-05-03T00:00:00+00:00', name='Landslide')]}):
+            sync_disasters()
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/1/').json()['fields']['name'], 'Landslide 1')
+
+    @patch('reliefweb.records.get_reliefweb_stats')
+    def test_misses_are_fetched_upstream_in_one_query(self, fetch):
+        fetch.return_value = {'data': [make_item(99, '2025-04-01T00:00:00+00:00')]}
+        response = self.client.get('/api/reliefweb/disasters/?ids=2,1,99,98&fields=id,name').json()
+
+        self.assertEqual([item['fields'] for item in response['data']], [
+            {'id': 2, 'name': 'Flood 2'}, {'id': 1, 'name': 'Flood 1'}, {'id': 99, 'name': 'Flood 99'}
+        ])
+        self.assertEqual(response['missing'], [98])
+        fetch.assert_called_once()
+        self.assertEqual(fetch.call_args[0][0]['filter'], {'field': 'id', 'value': [99, 98]})
+
+        # Everything, including the ID that doesn't exist, is cached now
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/reliefweb/disasters/?ids=2,1,99,98&fields=id,name').json()
+        self.assertEqual(again, response)
+        fetch.assert_called_once()
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/99/').json()['fields']['summary'], 'Heavy rain')
+
+    @patch('reliefweb.records.get_reliefweb_stats', side_effect=requests.ConnectionError('down'))
+    def test_upstream_failure(self, fetch):
+        response = self.client.get('/api/reliefweb/disasters/?ids=1,99').json()
+        self.assertEqual(response['count'], 1)
+        self.assertEqual(response['missing'], [99])
+        self.assertEqual(response['errors'], {'upstream': 'down'})
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/99/').status_code, 503)
+
+        fetch.side_effect = None
+        fetch.return_value = {'data': []}
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/99/').status_code, 404)
+
+    def test_invalid_params_are_rejected(self):
+        for params in ['ids=a', 'ids=', 'ids=' + ','.join(str(number) for number in range(101)), 'ids=1&fields=description']:
+            self.assertEqual(self.client.get(f'/api/reliefweb/disasters/?{params}').status_code, 400, params)
+
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [make_item(1, '2025-05-01T00:00:00+00:00')]}):
+            sync_disasters()
+
+    def test_matching_etag_gets_304(self):
+        first = self.client.get('/api/reliefweb/disasters/')
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        second = self.client.get('/api/reliefweb/disasters/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(second['ETag'], etag)
+
+    def test_unchanged_rebuild_keeps_validators(self):
+        first = self.client.get('/api/reliefweb/disasters/')
+        save_snapshot('disasters')
+
+        response = self.client.get('/api/reliefweb/disasters/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_data_gets_a_new_etag(self):
+        etag = self.client.get('/api/reliefweb/disasters/')['ETag']
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [make_item(1, '2025-05-02T00:00:00+00:00', status='past')]}):
+            sync_disasters()
+        save_snapshot('disasters')
+
+        response = self.client.get('/api/reliefweb/disasters/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_gzip_is_negotiated_and_compressed_once(self):
+        plain = self.client.get('/api/reliefweb/disasters/')
+        self.assertNotIn('Content-Encoding', plain)
+
+        with patch('gzip.compress', wraps=gzip.compress) as compress:
+            for _ in range(3):
+                response = self.client.get('/api/reliefweb/disasters/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compress.call_count, 1)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_compressed_variants_have_their_own_etag(self):
+        plain = self.client.get('/api/reliefweb/disasters/')
+        gzipped = self.client.get('/api/reliefweb/disasters/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['ETag'], plain['ETag'][:-1] + '-gzip"')
+
+        # Either form still matches, whichever encoding is asked for this time
+        for etag in (plain['ETag'], gzipped['ETag']):
+            response = self.client.get('/api/reliefweb/disasters/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], gzipped['ETag'])
+            self.assertEqual(self.client.get('/api/reliefweb/disasters/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_only_stored_bodies_keep_compressed_variants(self):
+        with patch('lib.http.cache') as variants:
+            variants.get.return_value = None
+            response = self.client.get('/api/reliefweb/disasters/1/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertFalse(variants.set.called)
+
+            self.client.get('/api/reliefweb/disasters/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertTrue(variants.set.called)
+
+    def test_refused_encoding_is_not_used(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertIsNone(choose_encoding(request))
+
+
+class DisasterListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [
+            make_item(1, '2025-03-01T00:00:00+00:00'),
+            make_item(2, '2025-04-01T00:00:00+00:00', iso3='phl', type_code='EQ'),
+            make_item(3, '2025-05-01T00:00:00+00:00', status='past'),
+            make_item(4, '2025-06-01T00:00:00+00:00', iso3='phl'),
+        ]}):
+            sync_disasters()
+
+    def get(self, query):
+        response = self.client.get(f'/api/reliefweb/disasters/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_fields_are_projected(self):
+        body = self.get('fields=name,primary_type')
+        self.assertEqual(set(body['data'][0]['fields']), {'id', 'name', 'primary_type'})
+
+    def test_projection_skips_unneeded_relations(self):
+        # Count, page; no country or type prefetches
+        with self.assertNumQueries(2):
+            self.client.get('/api/reliefweb/disasters/?fields=name,status')
+
+    def test_filters(self):
+        self.assertEqual([item['id'] for item in self.get('country=PHL')['data']], ['4', '2'])
+        self.assertEqual([item['id'] for item in self.get('type=earthquake')['data']], ['2'])
+        self.assertEqual([item['id'] for item in self.get('type=FL&status=alert')['data']], ['4', '1'])
+        self.assertEqual([item['id'] for item in self.get('from=2025-04-01&to=2025-05-01')['data']], ['3', '2'])
+
+    def test_cursor_pages_through_everything(self):
+        body = self.get('fields=id&limit=3')
+        self.assertEqual(body['totalCount'], 4)
+        seen = [item['id'] for item in body['data']]
+
+        body = self.get(f"fields=id&limit=3&cursor={body['next']}")
+        seen += [item['id'] for item in body['data']]
+
+        self.assertIsNone(body['next'])
+        self.assertEqual(seen, ['4', '3', '2', '1'])
+
+    def test_invalid_params_are_rejected(self):
+        for query in ('fields=secret', 'status=open', 'limit=5000', 'from=soon', 'cursor=zzz'):
+            self.assertEqual(self.client.get(f'/api/reliefweb/disasters/?{query}').status_code, 400, query)
+
+    def test_forged_cursors_are_rejected(self):
+        for values in (['garbage', 1], [None, 1], ['2025-05-01T00:00:00+00:00', 'x']):
+            response = self.client.get(f'/api/reliefweb/disasters/?cursor={encode_cursor(values)}')
+            self.assertEqual(response.status_code, 400, values)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        with patch('reliefweb.sync.get_reliefweb_stats', return_value={'data': [
+            make_item(id, f'2025-05-0{id}T00:00:00+00:00') for id in range(1, 6)
+        ]}):
+            sync_disasters()
+
+    def stream(self, query):
+        response = self.client.get(f'/api/reliefweb/disasters/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_resumes_from_a_cursor(self):
+        records = [json.loads(line) for line in self.stream('output=ndjson').splitlines()]
+        self.assertEqual([record['id'] for record in records], ['1', '2', '3', '4', '5'])
+
+        resumed = [json.loads(line) for line in self.stream(f"after={records[2]['cursor']}").splitlines()]
+        self.assertEqual([record['id'] for record in resumed], ['4', '5'])
+        for after in (encode_cursor(['x']), 'garbage'):
+            response = self.client.get(f'/api/reliefweb/disasters/export/?after={after}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'after': 'Invalid cursor'})
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(io.StringIO(self.stream('output=csv'))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['primary_country'], 'KEN')
+        self.assertEqual(rows[0]['types'], 'Flood')
+
+    def test_output_is_chunked(self):
+        chunks = list(export_disasters('ndjson', chunk_size=1))
+        self.assertEqual(len(chunks), 5)
+
+    async def test_asgi_export_streams_without_buffering(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get('/api/reliefweb/disasters/export/?output=ndjson')
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        # Django warns when it has to read a sync iterator whole to serve it over ASGI
+        self.assertEqual([str(warning.message) for warning in caught if 'StreamingHttpResponse' in str(warning.message)], [])
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], ['1', '2', '3', '4', '5'])
+
+    def test_unknown_output_is_rejected(self):
+        self.assertEqual(self.client.get('/api/reliefweb/disasters/export/?output=xml').status_code, 400)
@@ -0,0 +1,40 @@
+import html
+import re
+from django.utils.html import strip_tags
+
+# Characters kept in a summary, about two lines of a list item
+SUMMARY_LENGTH = 280
+
+# Markdown syntax, replaced by what it displays
+MARKDOWN = [
+    (re.compile(r'!\[[^\]]*\]\([^)]*\)'), ''),  # images
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),  # links
+    (re.compile(r'^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+', re.MULTILINE), ''),  # headings, quotes, list items
+    (re.compile(r'^\s{0,3}([-*_]\s*){3,}$', re.MULTILINE), ''),  # horizontal rules
+    (re.compile(r'(\*\*|__|\*|`)'), ''),  # emphasis and code
+]
+WHITESPACE = re.compile(r'\s+')
+
+
+def plain_text(description):
+    """
+    Returns the text of a markdown or HTML description, without markup.
+    """
+    text = html.unescape(strip_tags(description or ''))
+    for pattern, replacement in MARKDOWN:
+        text = pattern.sub(replacement, text)
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def make_summary(description, length=SUMMARY_LENGTH):
+    """
+    Returns a plain text excerpt of a description, cut at a word boundary.
+    """
+    text = plain_text(description)
+    if len(text) <= length:
+        return text
+    # One character more, so a word that ends exactly at the limit is kept
+    cut = text[:length + 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut[:length].rstrip(' ,;:.-') + '…'
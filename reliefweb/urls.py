@@ -1,7 +1,14 @@
 from django.urls import path
-from .views import reliefweb_disasters, reliefweb_stats
+from .views import reliefweb_disasters, reliefweb_disaster, reliefweb_disaster_description, reliefweb_disaster_changes, reliefweb_export, reliefweb_map, reliefweb_stats, reliefweb_dashboard, reliefweb_cache_stats
 
 urlpatterns = [
     path('disasters/', reliefweb_disasters),
-    path('stats/', reliefweb_stats)
+    path('disasters/<int:disaster_id>/', reliefweb_disaster),
+    path('disasters/<int:disaster_id>/description/', reliefweb_disaster_description),
+    path('disasters/changes/', reliefweb_disaster_changes),
+    path('disasters/export/', reliefweb_export),
+    path('map/', reliefweb_map),
+    path('stats/', reliefweb_stats),
+    path('dashboard/', reliefweb_dashboard),
+    path('cache/', reliefweb_cache_stats)
 ]
\ No newline at end of file
@@ -1,55 +1,149 @@
 import requests
-from django.http import JsonResponse
-from rest_framework.decorators import api_view
-from collections import Counter
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from lib.http import payload_response
+from lib.renderers import FastJsonResponse, cached_body, dumps
+from .dashboard import parse_dashboard_params, build_dashboard
+from .changes import TokenExpired, parse_changes_params, disaster_changes
+from .cache import cached_reliefweb_result, cache_stats, make_key
+from . import client
+from .export import OUTPUTS, parse_export_params, export_disasters, aexport_disasters
+from .geo import parse_map_params, country_layer, cluster_layer
+from .listing import parse_listing_params, disaster_listing
+from .models import Disaster
+from .records import parse_ids_params, get_disasters, disaster_records
+from .snapshots import get_snapshot
+from .stats import parse_stats_params, build_stats_query, build_stats_payload, empty_stats_payload
+from .sync import data_version
+
+
+def snapshot_response(request, name):
+    snapshot = get_snapshot(name)
+    return payload_response(request, snapshot['body'], etag=snapshot['etag'], last_modified=snapshot['modified_at'])
+
+
+def stored_response(request, name, build):
+    """
+    Serves a payload derived from the local store, built and encoded once
+    per set of query parameters until the next sync changes the store.
+    """
+    key = make_key({'view': name, 'version': data_version(), 'params': sorted(request.query_params.lists())})
+    body, etag = cached_body(key, build)
+    return payload_response(request, body, etag=etag)
+
 
-# User-Agent header (best practice)
-HEADERS = {
-    'User-Agent': 'CallumLiu-CrisisMap-CL96'
-}
+@api_view(['GET'])
+def reliefweb_disasters(request):
+    """
+    Returns the latest disasters, newest first, from the local store that
+    `manage.py sync_disasters` keeps up to date. Optional query parameters:
+    - fields: comma separated fields to include (default: all but the full
+      description, which `disasters/<id>/description/` serves)
+    - type, country, status: comma separated type codes/names, ISO3 codes, statuses
+    - from, to: creation date range (YYYY-MM-DD)
+    - limit: page size (default 100, at most 1000)
+    - cursor: the `next` value from the previous page
+    - ids: comma separated disaster IDs to fetch instead of a list page, with
+      `fields` to choose among the default fields; IDs that don't exist are
+      listed in `missing`
+    Without parameters the response is a pre-serialized snapshot refreshed in the background.
+    """
+    if not request.query_params:
+        return snapshot_response(request, 'disasters')
+    if 'ids' in request.query_params:
+        return payload_response(request, dumps(disaster_records(parse_ids_params(request.query_params))))
 
-# Base URL with appname query string explicitly included
-BASE_URL = "https://api.reliefweb.int/v2/disasters?appname=CallumLiu-CrisisMap-CL96"
+    options = parse_listing_params(request.query_params)
+    return stored_response(request, 'disasters', lambda: disaster_listing(options))
 
 
-def get_reliefweb_stats(query):
+@api_view(['GET'])
+def reliefweb_disaster(request, disaster_id):
     """
-    Makes a POST request to ReliefWeb API with a query JSON.
-    Returns a dict with at least 'data' and 'totalCount'.
+    Returns one disaster, in the same shape as the list items.
     """
+    records, error = get_disasters([disaster_id])
+    if disaster_id in records:
+        return payload_response(request, dumps(records[disaster_id]))
+    if error:
+        return FastJsonResponse({ 'detail': error }, status=503)
+    return FastJsonResponse({ 'detail': 'Not found.' }, status=404)
+
+
+@api_view(['GET'])
+def reliefweb_disaster_description(request, disaster_id):
+    """
+    Returns the full description of one disaster, which lists leave out in
+    favour of its `summary`.
+    """
+    disaster = get_object_or_404(Disaster.objects.only('id', 'description', 'date_changed'), id=disaster_id)
+    body = dumps({'id': str(disaster.id), 'description': disaster.description})
+    return payload_response(request, body, last_modified=disaster.date_changed)
+
+
+@api_view(['GET'])
+def reliefweb_disaster_changes(request):
+    """
+    Returns the disasters created, updated or closed since a version token,
+    each with a `change` of created/updated/closed, and the token to poll
+    with next. `more` is set when there are further changes to fetch straight away.
+    - since: the `token` from the previous response (without it only the
+      current token is returned, to start polling from)
+    - limit: changes per response (default 500, at most 1000)
+    A 410 means the token is too old to catch up from, and the list has to be reloaded.
+    """
+    options = parse_changes_params(request.query_params)
     try:
-        response = requests.post(BASE_URL, json=query, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException:
-        # If anything goes wrong, return empty structure
-        return {"data": [], "totalCount": 0}
+        return stored_response(request, 'changes', lambda: disaster_changes(options))
+    except TokenExpired:
+        return FastJsonResponse({ 'detail': 'This token has expired, reload the disasters list' }, status=410)
 
 
 @api_view(['GET'])
-def reliefweb_disasters(request):
+def reliefweb_map(request):
     """
-    Returns the latest disasters with full details.
+    Returns the map layer as a GeoJSON FeatureCollection built from the local
+    store, with disasters placed at their primary country's centroid.
+    - layer: `countries` (default), one point per country with its disaster
+      counts by type and status, or `clusters`, those countries grouped by
+      grid cell at `zoom`
+    - zoom: map zoom level for clusters (default 0, at most 10)
+    - bbox: min lon, min lat, max lon, max lat (default: the whole world);
+      clusters come for every tile the box touches
+    - type, country, status, from, to: the same filters as the disasters list
     """
-    query = {
-        'fields': {
-            'include': [
-                'id', 'name', 'status', 'primary_country', 'country',
-                'primary_type', 'type', 'url', 'date', 'description'
-            ]
-        },
-        'limit': 100,
-        'sort': ['date:desc']
-    }
+    options = parse_map_params(request.query_params)
+    if options['layer'] == 'countries':
+        return stored_response(request, 'map', lambda: country_layer(options))
+    return payload_response(request, dumps(cluster_layer(options)))
 
-    data = get_reliefweb_stats(query)
-    return JsonResponse(data, safe=False)
+
+@api_view(['GET'])
+def reliefweb_export(request):
+    """
+    Streams the full disaster history from the local store.
+    - output: ndjson (default) or csv
+    - after: resume after the record with this `cursor` value
+    """
+    params = parse_export_params(request.query_params)
+    # Each server streams only the iterator kind it expects without buffering it all first
+    export = aexport_disasters if isinstance(request._request, ASGIRequest) else export_disasters
+    response = StreamingHttpResponse(
+        export(params['output'], params['after']),
+        content_type=OUTPUTS[params['output']]
+    )
+    response['Content-Disposition'] = f"attachment; filename=\"disasters.{params['output']}\""
+    return response
 
 
 @api_view(['GET'])
 def reliefweb_stats(request):
     """
-    Returns aggregated stats for the latest 100 disasters:
+    Returns aggregated stats over every disaster created in the optional
+    `from`/`to` date range, bucketed over time by `interval`:
     - total count
     - active count
     - most recent disaster
@@ -57,82 +151,58 @@ def reliefweb_stats(request):
     - top affected countries
     - statuses
     - disasters over time
+    Everything comes from one ReliefWeb facet query. `stale` is set when the
+    stats come from an older cached response, and `degraded` when ReliefWeb
+    is failing. If there is nothing to serve, the stats are null with
+    `partial` set and the error in `errors`.
+    The default view (no parameters) is served from a snapshot.
     """
-    # Total disasters
-    total_data = get_reliefweb_stats({'limit': 1})
-    total_disasters = total_data.get('totalCount', 0)
+    params = parse_stats_params(request.query_params)
 
-    # Active disasters
-    active_data = get_reliefweb_stats({
-        'limit': 1,
-        'filter': {'field': 'status', 'value': 'alert'}
+    try:
+        if not request.query_params:
+            return snapshot_response(request, 'stats')
+        response, stale = cached_reliefweb_result(build_stats_query(params))
+    except requests.RequestException as error:
+        return FastJsonResponse({
+            **empty_stats_payload(params),
+            'partial': True,
+            'stale': False,
+            'degraded': True,
+            'errors': {'stats': str(error)}
+        })
+
+    body = dumps({
+        **build_stats_payload(response, params),
+        'partial': False,
+        'stale': stale,
+        'degraded': stale and client.breaker.is_failing,
+        'errors': {}
     })
-    active_disasters = active_data.get('totalCount', 0)
+    return payload_response(request, body)
 
-    # Most recent disaster
-    recent_data = get_reliefweb_stats({
-        'limit': 1,
-        'sort': ['date:desc'],
-        'fields': {'include': ['name', 'status', 'date', 'primary_country', 'primary_type']}
-    })
-    recent_disaster = {}
-    if recent_data.get('data') and len(recent_data['data']) > 0:
-        recent_disaster = recent_data['data'][0].get('fields', {})
-
-    # Latest disasters for stats
-    latest_data = get_reliefweb_stats({
-        'limit': 100,
-        'sort': ['date:desc'],
-        'fields': {'include': ['primary_type', 'primary_country', 'status', 'date']}
-    })
-    latest_items = latest_data.get('data', [])
 
-    # Count disaster types
-    commontype_counter = Counter(
-        item.get('fields', {}).get('primary_type', {}).get('name', 'Unknown')
-        for item in latest_items
-    )
-    most_common_type, most_common_count = commontype_counter.most_common(1)[0] if commontype_counter else ("N/A", 0)
-
-    # Top affected countries
-    countries_counter = Counter()
-    for item in latest_items:
-        country = item.get('fields', {}).get('primary_country')
-        if country:
-            iso3 = country.get('iso3', 'N/A').upper()
-            name = country.get('name', 'Unknown')
-            countries_counter[(iso3, name)] += 1
-    top_countries = [
-        {'iso3': iso3, 'name': name, 'disasters': count}
-        for ((iso3, name), count) in countries_counter.most_common(10)
-    ]
-
-    # Status counts
-    status_counter = Counter(
-        item.get('fields', {}).get('status', 'Unknown')
-        for item in latest_items
-    )
+@api_view(['GET'])
+def reliefweb_dashboard(request):
+    """
+    Returns everything the first page load needs in one response:
+    - disasters: the default disasters list
+    - stats: the default stats
+    - counts: comment counts for the listed disasters, keyed by ID
+    - comments: the first page of comments on `event`
+    - sections: comma separated sections to include (default: disasters,
+      stats and counts, plus comments when `event` is given)
+    Sections are the same payloads as their own endpoints. One that fails
+    is null, with the error in `errors`.
+    """
+    body = build_dashboard(request, parse_dashboard_params(request.query_params))
+    return payload_response(request, body)
 
-    # Disasters over time
-    monthly_counts = {}
-    for item in latest_items:
-        created_time = item.get('fields', {}).get('date', {}).get('created')
-        if created_time and 'T' in created_time:
-            parts = created_time.split('T')[0].split('-')
-            if len(parts) >= 2:
-                year_month = f"{parts[0]}-{parts[1].zfill(2)}"
-                monthly_counts[year_month] = monthly_counts.get(year_month, 0) + 1
-
-    disasters_overtime = [{'month': m, 'count': c} for m, c in sorted(monthly_counts.items())]
-
-    return JsonResponse({
-        'total': total_disasters,
-        'active_count': active_disasters,
-        'recent_disaster': recent_disaster,
-        'common_type': most_common_type,
-        'common_count': most_common_count,
-        'top_countries': top_countries,
-        'status_list': dict(status_counter),
-        'disasters_overtime': disasters_overtime,
-        'type_list': dict(commontype_counter)
-    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def reliefweb_cache_stats(request):
+    """
+    Returns this worker's ReliefWeb cache hit/miss counters.
+    """
+    return FastJsonResponse(cache_stats())
@@ -0,0 +1,143 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Count, F, Sum
+from reliefweb.text import plain_text
+from .models import SearchDocument, SearchTerm
+
+# Text search configuration on Postgres, used for both indexing and queries
+CONFIG = 'english'
+
+# Postgres weights per document field, and the scores the SearchTerm fallback gives them
+WEIGHTS = {'title': 'A', 'facets': 'B', 'body': 'C'}
+TERM_SCORES = {'title': 4, 'facets': 2, 'body': 1}
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were', 'will', 'with',
+}
+WORD = re.compile(r'\w+')
+MAX_TERM_LENGTH = 100
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def normalize(word):
+    # Just enough stemming for plurals, so "floods" finds "Flood"
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [
+        normalize(word)[:MAX_TERM_LENGTH] for word in WORD.findall(text.lower())
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def save_documents(kind, documents):
+    """
+    Upserts the search documents of one kind, from a dict of object id to
+    {'title', 'facets', 'body'}, and refreshes their index entries.
+    """
+    if not documents:
+        return
+    existing = {
+        document.object_id: document
+        for document in SearchDocument.objects.filter(kind=kind, object_id__in=documents)
+    }
+    created, updated = [], []
+    for object_id, fields in documents.items():
+        document = existing.get(object_id) or SearchDocument(kind=kind, object_id=object_id)
+        for name in WEIGHTS:
+            setattr(document, name, fields.get(name, ''))
+        (updated if object_id in existing else created).append(document)
+    SearchDocument.objects.bulk_create(created)
+    SearchDocument.objects.bulk_update(updated, list(WEIGHTS))
+
+    saved = SearchDocument.objects.filter(kind=kind, object_id__in=documents)
+    if uses_postgres():
+        # Computed by the database in one UPDATE, with the same configuration queries use
+        vector = None
+        for name, weight in WEIGHTS.items():
+            field_vector = SearchVector(name, weight=weight, config=CONFIG)
+            vector = field_vector if vector is None else vector + field_vector
+        saved.update(vector=vector)
+        return
+
+    ids = dict(saved.values_list('object_id', 'id'))
+    SearchTerm.objects.filter(document_id__in=ids.values()).delete()
+    terms = []
+    for object_id, fields in documents.items():
+        scores = {}
+        for name, score in TERM_SCORES.items():
+            for term in set(tokenize(fields.get(name, ''))):
+                scores[term] = scores.get(term, 0) + score
+        terms += [SearchTerm(document_id=ids[object_id], term=term, weight=score) for term, score in scores.items()]
+    SearchTerm.objects.bulk_create(terms)
+
+
+def remove_documents(kind, object_ids):
+    SearchDocument.objects.filter(kind=kind, object_id__in=list(object_ids)).delete()
+
+
+def index_disasters(disasters):
+    """
+    Indexes disasters by name, countries, types and plain text description.
+    Pass them with countries, types and the primary relations prefetched.
+    """
+    documents = {}
+    for disaster in disasters:
+        facets = []
+        for country in disaster.countries.all():
+            facets += [country.name, country.iso3]
+        for disaster_type in disaster.types.all():
+            facets += [disaster_type.name, disaster_type.code]
+        documents[disaster.id] = {
+            'title': disaster.name,
+            'facets': ' '.join(facets),
+            'body': plain_text(disaster.description),
+        }
+    save_documents(SearchDocument.DISASTER, documents)
+
+
+def index_comments(comments):
+    save_documents(SearchDocument.COMMENT, {comment.id: {'body': comment.content} for comment in comments})
+
+
+def remove_author(author):
+    # Their comments go with the account
+    remove_documents(SearchDocument.COMMENT, author.comments.values_list('id', flat=True))
+
+
+def search_documents(query, kind, limit):
+    """
+    Returns up to `limit` (object id, rank) pairs of one kind matching every
+    word of `query`, best first: through the GIN-indexed tsvector on
+    Postgres, and through the SearchTerm inverted index elsewhere.
+    """
+    if uses_postgres():
+        search_query = SearchQuery(query, search_type='websearch', config=CONFIG)
+        return list(
+            SearchDocument.objects.filter(kind=kind, vector=search_query)
+            .annotate(rank=SearchRank(F('vector'), search_query))
+            .order_by('-rank', '-object_id')
+            .values_list('object_id', 'rank')[:limit]
+        )
+
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    return list(
+        SearchTerm.objects.filter(document__kind=kind, term__in=terms)
+        .values('document__object_id')
+        .annotate(matched=Count('id'), rank=Sum('weight'))
+        .filter(matched=len(terms))
+        .order_by('-rank', '-document__object_id')
+        .values_list('document__object_id', 'rank')[:limit]
+    )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comments.models import Comment
+from reliefweb.models import Disaster
+from search.index import index_comments, index_disasters
+from search.models import SearchDocument
+
+BATCH_SIZE = 500
+
+
+def batches(queryset):
+    # By id rather than offset, so rows indexed in one batch can't shift the next
+    ids = list(queryset.values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield queryset.filter(id__in=ids[start:start + BATCH_SIZE])
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index of every disaster and comment from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only index disasters and comments with no search document yet, e.g. after the first deploy'
+        )
+
+    def handle(self, *args, **options):
+        disasters = Disaster.objects.prefetch_related('countries', 'types').order_by('id')
+        comments = Comment.objects.order_by('id')
+
+        with transaction.atomic():
+            if options['missing']:
+                disasters = disasters.exclude(id__in=SearchDocument.objects.filter(
+                    kind=SearchDocument.DISASTER
+                ).values('object_id'))
+                comments = comments.exclude(id__in=SearchDocument.objects.filter(
+                    kind=SearchDocument.COMMENT
+                ).values('object_id'))
+            else:
+                SearchDocument.objects.all().delete()
+
+            disaster_count = comment_count = 0
+            for batch in batches(disasters):
+                batch = list(batch)
+                index_disasters(batch)
+                disaster_count += len(batch)
+            for batch in batches(comments):
+                batch = list(batch)
+                index_comments(batch)
+                comment_count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {disaster_count} disasters and {comment_count} comments'
+        ))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:26
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('disaster', 'Disaster'), ('comment', 'Comment')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('title', models.TextField(blank=True, help_text='Highest weight: disaster name')),
+                ('facets', models.TextField(blank=True, help_text='Countries and types')),
+                ('body', models.TextField(blank=True, help_text='Plain text description or comment content')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='searchdocument_kind_object_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='search.searchdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'document'], name='searchterm_term_document_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+INDEX_NAME = 'searchdocument_vector_gin'
+
+
+def create_index(apps, schema_editor):
+    # GIN is Postgres only; other databases search through SearchTerm instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX {INDEX_NAME} ON search_searchdocument USING gin (vector)')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
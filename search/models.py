@@ -0,0 +1,42 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+
+# One row per searchable record, kept in step with disasters and comments by search.index
+class SearchDocument(models.Model):
+    DISASTER, COMMENT = 'disaster', 'comment'
+    KINDS = [(DISASTER, 'Disaster'), (COMMENT, 'Comment')]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.IntegerField()
+    title = models.TextField(blank=True, help_text='Highest weight: disaster name')
+    facets = models.TextField(blank=True, help_text='Countries and types')
+    body = models.TextField(blank=True, help_text='Plain text description or comment content')
+    # Postgres only; the GIN index on it is created by migration 0002
+    vector = SearchVectorField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchdocument_kind_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class SearchTerm(models.Model):
+    # Inverted index used instead of the tsvector on databases other than Postgres
+    document = models.ForeignKey(
+        to=SearchDocument,
+        related_name='terms',
+        on_delete=models.CASCADE
+    )
+    term = models.CharField(max_length=100)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'document'], name='searchterm_term_document_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.term} in {self.document}'
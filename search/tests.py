@@ -0,0 +1,109 @@
+import io
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase
+from comments.models import Comment
+from users.models import User
+from users.serializers.token import CustomTokenSerializer
+from reliefweb.sync import sync_disasters
+from .index import tokenize
+from .models import SearchDocument, SearchTerm
+
+KENYA = {'id': 1, 'name': 'Kenya', 'shortname': 'Kenya', 'iso3': 'ken'}
+PHILIPPINES = {'id': 188, 'name': 'Philippines', 'shortname': 'Philippines', 'iso3': 'phl'}
+FLOOD = {'id': 4611, 'name': 'Flood', 'code': 'FL'}
+EARTHQUAKE = {'id': 4628, 'name': 'Earthquake', 'code': 'EQ'}
+
+
+def make_item(id, name, country, disaster_type, description='', changed='2025-05-01T00:00:00+00:00'):
+    return {'id': str(id), 'fields': {
+        'id': id,
+        'name': name,
+        'status': 'alert',
+        'description': description,
+        'date': {'created': changed, 'changed': changed},
+        'primary_country': country,
+        'country': [country],
+        'primary_type': disaster_type,
+        'type': [disaster_type],
+    }}
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        with patch('reliefweb.sync.get_reliefweb_stats') as fetch:
+            fetch.return_value = {'data': [
+                make_item(1, 'Kenya: Floods - May 2025', KENYA, FLOOD, '<p>Heavy rains in <b>Nairobi</b></p>'),
+                make_item(2, 'Philippines: Earthquake - May 2025', PHILIPPINES, EARTHQUAKE, '<p>Aftershocks and flooding of coastal roads</p>'),
+            ]}
+            sync_disasters()
+
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        token = CustomTokenSerializer.get_token(self.user).access_token
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, results):
+        return [item['id'] for item in results]
+
+    def test_disasters_are_ranked_by_name_country_type_and_description(self):
+        self.assertEqual(self.ids(self.search('kenya floods')['disasters']), ['1'])
+        self.assertEqual(self.ids(self.search('EQ')['disasters']), ['2'])
+        self.assertEqual(self.ids(self.search('nairobi')['disasters']), ['1'])
+        # A name match outranks a description match
+        self.assertEqual(self.ids(self.search('flood')['disasters']), ['1'])
+        self.assertEqual(self.ids(self.search('flooding')['disasters']), ['2'])
+
+    def test_sync_reindexes_changed_disasters(self):
+        with patch('reliefweb.sync.get_reliefweb_stats') as fetch:
+            fetch.return_value = {'data': [
+                make_item(1, 'Kenya: Landslides - May 2025', KENYA, FLOOD, changed='2025-05-03T00:00:00+00:00'),
+            ]}
+            sync_disasters()
+
+        self.assertEqual(self.search('landslides')['disasters'][0]['id'], '1')
+        self.assertEqual(self.search('nairobi')['disasters'], [])
+        self.assertEqual(SearchDocument.objects.filter(kind=SearchDocument.DISASTER).count(), 2)
+
+    def test_comments_are_indexed_as_they_are_written(self):
+        comment = self.client.post('/api/comments/', {'content': 'Bridge washed away near Garissa', 'event': 1}).json()
+        self.assertEqual(self.ids(self.search('garissa bridge', type='comments')['comments']), [comment['id']])
+
+        self.client.put(f"/api/comments/{comment['id']}/", {'content': 'Roads reopened', 'event': 1}, content_type='application/json')
+        self.assertEqual(self.search('garissa', type='comments')['comments'], [])
+        self.assertEqual(len(self.search('reopened', type='comments')['comments']), 1)
+
+        self.client.delete(f"/api/comments/{comment['id']}/")
+        self.assertEqual(self.search('reopened', type='comments')['comments'], [])
+        self.assertFalse(SearchTerm.objects.filter(term='reopened').exists())
+
+    def test_search_is_an_index_lookup_plus_one_fetch(self):
+        # The first request reads the user's row for the token checks, later ones get it from the cache
+        self.search('kenya')
+        with self.assertNumQueries(2):
+            self.search('flood', type='disasters')
+
+    def test_missing_documents_are_backfilled(self):
+        # Records from before search existed, as on the first deploy
+        comment = Comment.objects.create(content='Nairobi roads flooded', author=self.user, event=1)
+        SearchDocument.objects.filter(kind=SearchDocument.COMMENT).delete()
+        SearchDocument.objects.filter(kind=SearchDocument.DISASTER, object_id=2).delete()
+        kept = SearchDocument.objects.get(kind=SearchDocument.DISASTER, object_id=1)
+
+        output = io.StringIO()
+        call_command('rebuild_search_index', '--missing', stdout=output)
+        self.assertIn('Indexed 1 disasters and 1 comments', output.getvalue())
+        self.assertEqual(SearchDocument.objects.get(kind=SearchDocument.DISASTER, object_id=1).pk, kept.pk)
+        self.assertEqual(self.ids(self.search('earthquake')['disasters']), ['2'])
+        self.assertEqual(self.ids(self.search('roads flooded')['comments']), [comment.id])
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.client.get('/api/search/?q=a').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/?q=flood&type=users').status_code, 400)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('The Floods of the Philippines, 2025'), ['flood', 'philippine', '2025'])
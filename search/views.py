@@ -0,0 +1,59 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from comments.models import Comment
+from comments.serializers.common import CommentSerializer
+from reliefweb.models import Disaster
+from reliefweb.serializers.common import DisasterSerializer
+from .index import search_documents
+from .models import SearchDocument
+
+TYPES = ['disasters', 'comments']
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# What each disaster result carries; descriptions are left to the disaster endpoints
+DISASTER_FIELDS = ['id', 'name', 'status', 'primary_country', 'primary_type', 'url', 'date', 'summary']
+
+
+class SearchView(APIView):
+    """
+    Searches disasters by name, country, type and description, and comments
+    by content, best match first.
+    - q: the words to find (all of them must match)
+    - type: disasters, comments or both comma separated (default: both)
+    - limit: results per type (default 20, at most 50)
+    """
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            raise ValidationError({ 'q': f'Must be at least {MIN_QUERY_LENGTH} characters' })
+
+        types = [value for value in request.query_params.get('type', '').split(',') if value] or TYPES
+        if any(value not in TYPES for value in types):
+            raise ValidationError({ 'type': f"Must be one of: {', '.join(TYPES)}" })
+
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({ 'limit': 'Must be a number' })
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        results = {'query': query}
+        if 'disasters' in types:
+            hits = search_documents(query, SearchDocument.DISASTER, limit)
+            disasters = Disaster.objects.select_related('primary_country', 'primary_type').defer('description').in_bulk([id for id, _ in hits])
+            results['disasters'] = [
+                {**DisasterSerializer(disasters[id], fields=DISASTER_FIELDS).data, 'rank': rank}
+                for id, rank in hits if id in disasters
+            ]
+        if 'comments' in types:
+            hits = search_documents(query, SearchDocument.COMMENT, limit)
+            comments = Comment.objects.select_related('author').in_bulk([id for id, _ in hits])
+            results['comments'] = [
+                {**CommentSerializer(comments[id]).data, 'rank': rank}
+                for id, rank in hits if id in comments
+            ]
+        return Response(results)
@@ -1,5 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from lib.authentication import forget_user
 
 class User(AbstractUser):
-    email = models.EmailField(max_length=100)
\ No newline at end of file
+    email = models.EmailField(max_length=100)
+    # Put in the tokens issued to the user and moved on to revoke them all
+    token_version = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Tokens are checked against the cached row, so e.g. deactivating the user in the admin applies at once
+        forget_user(self.pk)
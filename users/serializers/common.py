@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from ..models import User
 from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import make_password
+from lib.authentication import revoke_tokens, forget_user
+from lib.hashing import hash_password
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
@@ -22,14 +25,31 @@ class UserSerializer(serializers.ModelSerializer):
         return data
     
     def create(self, validated_data):
-        validated_data.pop('password_confirmation')
-        return User.objects.create_user(**validated_data)
+        validated_data.pop('password_confirmation', None)
+        password = validated_data.pop('password', None)
+        # Registration hashes the password before saving, off the event loop, and passes the hash in
+        encoded = validated_data.pop('encoded_password', None)
+
+        user = User(**validated_data)
+        user.username = User.normalize_username(user.username)
+        user.email = User.objects.normalize_email(user.email)
+        user.password = encoded or (hash_password(password) if password else make_password(None))
+        user.save()
+        return user
     
     def update(self, instance, validated_data):
-        if 'password' in validated_data:
+        password_changed = 'password' in validated_data
+        if password_changed:
             password = validated_data.pop('password', None)
             validated_data.pop('password_confirmation', None)
             password_validation.validate_password(password, instance)
-            instance.set_password(password)
+            instance.password = hash_password(password)
+            # As set_password does, so saving tells the validators the password changed
+            instance._password = password
 
-        return super().update(instance, validated_data)
\ No newline at end of file
+        user = super().update(instance, validated_data)
+        if password_changed:
+            revoke_tokens(user.id)
+        else:
+            forget_user(user.id)
+        return user
\ No newline at end of file
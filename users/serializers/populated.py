@@ -1,10 +1,38 @@
 from rest_framework import serializers
 from ..models import User
 from comments.serializers.common import CommentSerializer
+from lib.pagination import KeysetPagination, encode_cursor
+
+# Profiles show the newest comments only, the rest are paged through /api/comments/?user=<id>
+PROFILE_COMMENTS = 20
 
 class ProfileSerializer(serializers.ModelSerializer):
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
+    comment_count = serializers.SerializerMethodField()
+    comments_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'username', 'comments']
\ No newline at end of file
+        fields = ['id', 'email', 'username', 'comments', 'comment_count', 'comments_cursor']
+
+    def get_latest_comments(self, obj):
+        # One extra row tells the cursor field whether there are more, kept so both fields share a query
+        latest = self.context.setdefault('latest_comments', {})
+        if obj.pk not in latest:
+            latest[obj.pk] = list(
+                obj.comments.select_related('author').order_by('-created_at', '-id')[:PROFILE_COMMENTS + 1]
+            )
+        return latest[obj.pk]
+
+    def get_comments(self, obj):
+        return CommentSerializer(self.get_latest_comments(obj)[:PROFILE_COMMENTS], many=True).data
+
+    def get_comment_count(self, obj):
+        return obj.comments.count()
+
+    def get_comments_cursor(self, obj):
+        # Cursor for /api/comments/?user=<id> to carry on from the last comment shown
+        comments = self.get_latest_comments(obj)
+        if len(comments) <= PROFILE_COMMENTS:
+            return None
+        return encode_cursor(KeysetPagination().get_position(comments[PROFILE_COMMENTS - 1]))
@@ -9,4 +9,8 @@ class CustomTokenSerializer(TokenObtainPairSerializer):
             'id': user.id,
             'username': user.username,
         }
+        # Read by the stateless token user, e.g. for IsAdminUser
+        token['is_staff'] = user.is_staff
+        # Checked against the user's current version, see lib.authentication
+        token['ver'] = user.token_version
         return token
\ No newline at end of file
@@ -1,3 +1,221 @@
-from django.test import TestCase
+import asyncio
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from comments.models import Comment
+from lib import hashing
+from lib.hashing import ahash_password
+from .models import User
+from .serializers.token import CustomTokenSerializer
 
-# Create your tests here.
+
+def thread_names():
+    return [thread.name for thread in threading.enumerate()]
+
+
+class ProfileQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        Comment.objects.bulk_create([
+            Comment(content=f'Update {number}', author=cls.user, event=number % 7)
+            for number in range(60)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def authenticate(self):
+        token = CustomTokenSerializer.get_token(self.user).access_token
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    def test_public_profile_uses_fixed_queries(self):
+        # User, latest comments, comment count
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/auth/profile/{self.user.id}')
+
+        body = response.json()
+        self.assertEqual(len(body['comments']), 20)
+        self.assertEqual(body['comment_count'], 60)
+        self.assertIsNotNone(body['comments_cursor'])
+
+    def test_own_profile_uses_fixed_queries(self):
+        self.authenticate()
+        # User row (then cached), latest comments, comment count
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(len(response.json()['comments']), 20)
+        with self.assertNumQueries(2):
+            self.client.get('/api/auth/profile/')
+
+    def test_profile_cursor_continues_in_the_comment_list(self):
+        profile = self.client.get(f'/api/auth/profile/{self.user.id}').json()
+        page = self.client.get(f"/api/comments/?user={self.user.id}&cursor={profile['comments_cursor']}").json()
+
+        shown = [comment['id'] for comment in profile['comments'] + page['results']]
+        expected = list(Comment.objects.order_by('-created_at', '-id').values_list('id', flat=True)[:40])
+        self.assertEqual(shown, expected)
+
+    def test_profile_without_more_comments_has_no_cursor(self):
+        quiet = User.objects.create_user(username='quiet', email='quiet@example.com', password='pass12345!')
+        body = self.client.get(f'/api/auth/profile/{quiet.id}').json()
+        self.assertEqual(body['comments'], [])
+        self.assertEqual(body['comment_count'], 0)
+        self.assertIsNone(body['comments_cursor'])
+
+
+class StatelessAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+        self.other = User.objects.create_user(username='bystander', email='bystander@example.com', password='pass12345!')
+        self.token = str(CustomTokenSerializer.get_token(self.user).access_token)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {self.token}'
+
+    def test_authenticated_reads_reuse_the_cached_user(self):
+        # The token version is checked against the User row, loaded once and then cached
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/comments/counts/?events=1')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            self.client.get('/api/comments/counts/?events=1')
+
+    def test_ownership_checks_use_the_token_user(self):
+        own = Comment.objects.create(content='Mine', author=self.user, event=1)
+        theirs = Comment.objects.create(content='Theirs', author=self.other, event=1)
+
+        self.assertEqual(self.client.delete(f'/api/comments/{theirs.id}/').status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/comments/{own.id}/').status_code, 204)
+        self.assertEqual(self.client.put(f'/api/auth/profile/{self.other.id}', {'email': 'x@example.com'}, content_type='application/json').status_code, 403)
+
+    def test_password_change_revokes_existing_tokens(self):
+        response = self.client.put('/api/auth/profile/', {
+            'password': 'n3w-passw0rd!',
+            'password_confirmation': 'n3w-passw0rd!'
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/comments/', {'content': 'Still me?', 'event': 1})
+        self.assertEqual(response.status_code, 401)
+
+        # Revocation is on the User row, so it outlives the cache
+        cache.clear()
+        self.assertEqual(self.client.post('/api/comments/', {'content': 'Still me?', 'event': 1}).status_code, 401)
+
+        # A token from logging in again straight away is accepted
+        tokens = self.client.post('/api/auth/login/', {'username': 'reporter', 'password': 'n3w-passw0rd!'}, content_type='application/json').json()
+        response = self.client.post('/api/comments/', {'content': 'Me again', 'event': 1}, HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(response.status_code, 201)
+
+    def test_deactivated_users_are_rejected(self):
+        self.assertEqual(self.client.post('/api/comments/', {'content': 'Before', 'event': 1}).status_code, 201)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.post('/api/comments/', {'content': 'After', 'event': 1})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), { 'detail': 'User is inactive' })
+
+    def test_account_deletion_revokes_existing_tokens(self):
+        self.assertEqual(self.client.delete('/api/auth/profile/').status_code, 204)
+        response = self.client.post('/api/comments/', {'content': 'Ghost', 'event': 1})
+        self.assertEqual(response.status_code, 401)
+
+    def test_profile_edit_is_not_served_stale(self):
+        self.client.get('/api/auth/profile/')
+        self.client.put('/api/auth/profile/', {'email': 'new@example.com'}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['email'], 'new@example.com')
+
+
+class AuthHashingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reporter', email='reporter@example.com', password='pass12345!')
+
+    def login(self, username='reporter', password='pass12345!'):
+        return self.client.post('/api/auth/login/', {'username': username, 'password': password}, content_type='application/json')
+
+    def test_register_and_login(self):
+        response = self.client.post('/api/auth/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'n3w-passw0rd!', 'password_confirmation': 'n3w-passw0rd!'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(username='newcomer').check_password('n3w-passw0rd!'))
+
+        tokens = self.login('newcomer', 'n3w-passw0rd!').json()
+        self.assertEqual(AccessToken(tokens['access'])['user']['username'], 'newcomer')
+        self.assertIn('refresh', tokens)
+
+    def test_bad_credentials_are_rejected(self):
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertEqual(self.login(username='nobody').status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/login/', {'username': 'reporter'}).json(), {'password': ['This field is required.']})
+
+        mismatched = self.client.post('/api/auth/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'n3w-passw0rd!', 'password_confirmation': 'other'
+        })
+        self.assertEqual(mismatched.status_code, 400)
+
+    def test_outdated_hashes_are_upgraded_at_login(self):
+        self.user.password = PBKDF2PasswordHasher().encode('pass12345!', 'saltsalt', iterations=1000)
+        self.user.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertNotIn('$1000$', self.user.password)
+        self.assertTrue(self.user.check_password('pass12345!'))
+
+    @override_settings(PASSWORD_HASH_MAX_PENDING=0)
+    def test_overflow_is_turned_away(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(AUTH_THROTTLE_RATE='2/minute')
+    def test_attempts_are_throttled_per_ip(self):
+        self.assertEqual([self.login(password='wrong').status_code for _ in range(3)], [401, 401, 429])
+        self.assertEqual(self.login(password='wrong').status_code, 429)
+        self.assertEqual(self.client.post('/api/auth/login/', REMOTE_ADDR='10.0.0.2', data={'username': 'reporter', 'password': 'pass12345!'}).status_code, 200)
+
+    def test_a_broken_pool_is_replaced(self):
+        pool = hashing.get_pool()
+        # A worker dying, as when it is killed for memory, breaks the whole pool
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIsNot(hashing.get_pool(), pool)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_workers_do_not_run_the_snapshot_scheduler(self):
+        with patch.dict(os.environ, {'RELIEFWEB_SCHEDULER': 'True'}), patch.object(hashing, '_pool', None):
+            pool = hashing.get_pool()
+            try:
+                names = pool.submit(thread_names).result()
+            finally:
+                pool.shutdown()
+        self.assertNotIn('reliefweb-snapshots', names)
+
+    async def test_hashing_leaves_the_event_loop_free(self):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticker = asyncio.create_task(tick())
+        encoded = await asyncio.gather(*[ahash_password('pass12345!') for _ in range(4)])
+        ticker.cancel()
+        self.assertTrue(all(check_password('pass12345!', value) for value in encoded))
+        # Four PBKDF2 hashes take long enough for the loop to run many times meanwhile
+        self.assertGreater(ticks, 10)
@@ -1,10 +1,9 @@
 from django.urls import path
-from .views import RegisterUserView, ProfileView, PublicProfileView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from .views import register_user, login_user, ProfileView, PublicProfileView
 
 urlpatterns = [
-    path('register/', RegisterUserView.as_view()),
-    path('login/', TokenObtainPairView.as_view()),
+    path('register/', register_user),
+    path('login/', login_user),
     path('profile/', ProfileView.as_view()),
     path('profile/<int:pk>', PublicProfileView.as_view())
 ]
\ No newline at end of file
@@ -1,37 +1,137 @@
+import json
+import math
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import update_last_login
+from django.db import transaction
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from .models import User
+from comments.models import EventCommentCount
+from lib.authentication import get_full_user, revoke_tokens
+from lib.hashing import HashingBusy, acheck_password, ahash_password
+from lib.renderers import FastJsonResponse
+from lib.throttling import AuthRateThrottle
 from lib.permissions import IsUserItself
+from search import index as search_index
 from .serializers.common import UserSerializer
 from .serializers.populated import ProfileSerializer
+from .serializers.token import CustomTokenSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.generics import RetrieveUpdateDestroyAPIView
 
-class RegisterUserView(APIView):
-    permission_classes = [AllowAny]
+def request_data(request):
+    # JSON or form fields, as the DRF views these replace accepted; None if unreadable
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST.dict()
+
+
+async def throttled(request):
+    throttle = AuthRateThrottle()
+    if await sync_to_async(throttle.allow_request)(request, None):
+        return None
+    wait = math.ceil(throttle.wait() or 1)
+    response = FastJsonResponse({ 'detail': f'Too many attempts, try again in {wait} seconds.' }, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def busy_response(error):
+    response = FastJsonResponse({ 'detail': str(error.detail) }, status=error.status_code)
+    response['Retry-After'] = '1'
+    return response
+
+
+# Login and registration are async: their password hashing runs in the
+# bounded process pool in lib.hashing, and the event loop serves other
+# requests while they wait for it
+
+@csrf_exempt
+@require_POST
+async def register_user(request):
+    rejected = await throttled(request)
+    if rejected:
+        return rejected
+    data = request_data(request)
+    if data is None:
+        return FastJsonResponse({ 'detail': 'Invalid request body'}, status=400)
+
+    serialized_user = UserSerializer(data=data)
+    if not await sync_to_async(serialized_user.is_valid)():
+        return FastJsonResponse(serialized_user.errors, status=400)
+
+    password = serialized_user.validated_data.get('password')
+    try:
+        encoded = await ahash_password(password) if password else None
+    except HashingBusy as error:
+        return busy_response(error)
+    await sync_to_async(serialized_user.save)(encoded_password=encoded)
+    return FastJsonResponse({ 'detail': 'You have created an account!'})
+
+
+@csrf_exempt
+@require_POST
+async def login_user(request):
+    """
+    Returns a refresh and an access token for a username and password, as
+    simplejwt's TokenObtainPairView does.
+    """
+    rejected = await throttled(request)
+    if rejected:
+        return rejected
+    data = request_data(request)
+    if data is None:
+        return FastJsonResponse({ 'detail': 'Invalid request body'}, status=400)
+
+    errors = {name: ['This field is required.'] for name in (User.USERNAME_FIELD, 'password') if not data.get(name)}
+    if errors:
+        return FastJsonResponse(errors, status=400)
+
+    user = await User.objects.filter(**{User.USERNAME_FIELD: data[User.USERNAME_FIELD]}).afirst()
+    try:
+        # Checked against no hash at all for an unknown user, which takes as long
+        is_correct, upgraded = await acheck_password(data['password'], user.password if user else None)
+    except HashingBusy as error:
+        return busy_response(error)
+    if not is_correct or not user.is_active:
+        return FastJsonResponse({ 'detail': 'No active account found with the given credentials'}, status=401)
+
+    if upgraded:
+        user.password = upgraded
+        await user.asave(update_fields=['password'])
+    if jwt_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+    refresh = CustomTokenSerializer.get_token(user)
+    return FastJsonResponse({'refresh': str(refresh), 'access': str(refresh.access_token)})
 
-    def post(self, request):
-        serialized_user = UserSerializer(data=request.data)
-        serialized_user.is_valid(raise_exception=True)
-        serialized_user.save()
-        return Response({ 'detail': 'You have created an account!'})
-    
 class ProfileView(APIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get(self, request):
-        profile = ProfileSerializer(request.user)
+        profile = ProfileSerializer(get_full_user(request.user.id))
         return Response(profile.data)
     
     def put(self, request):
-        user = request.user
+        user = User.objects.get(pk=request.user.id)
         edit_serializer = UserSerializer(user, data=request.data, partial=True)
         edit_serializer.is_valid(raise_exception=True)
         edit_serializer.save()
         return Response(edit_serializer.data)
     
+    @transaction.atomic
     def delete(self, request):
-        request.user.delete()
+        user = User.objects.get(pk=request.user.id)
+        EventCommentCount.remove_author(user)
+        search_index.remove_author(user)
+        user.delete()
+        revoke_tokens(request.user.id)
         return Response({ 'detail': 'User deleted'}, status=204)
     
 class PublicProfileView(RetrieveUpdateDestroyAPIView):
@@ -46,4 +146,12 @@ class PublicProfileView(RetrieveUpdateDestroyAPIView):
         if self.request.method == 'GET':
             return ProfileSerializer
 
-        return UserSerializer
\ No newline at end of file
+        return UserSerializer
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        user_id = instance.id
+        EventCommentCount.remove_author(instance)
+        search_index.remove_author(instance)
+        instance.delete()
+        revoke_tokens(user_id)
\ No newline at end of file